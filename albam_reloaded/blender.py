@@ -53,6 +53,11 @@ class AlbamSettings(bpy.types.PropertyGroup):
         description="Automatically transfer normals from a temporary copy",
         default=True
     )
+    tight_bounding_spheres_bool: bpy.props.BoolProperty(
+        name="AlbamSet tight bounding spheres",
+        description="Fit smaller bounding spheres on export (Ritter's algorithm), so meshes are culled less",
+        default=False
+    )
 
 
 class CopyCustomPropertiesMat(bpy.types.Operator):
@@ -313,6 +318,8 @@ class ALBAM_PT_ImportExportPanel(bpy.types.Panel):
                     text="Ignore missing .mod files")
         layout.prop(export_settings, "clear_temp_foder_bool",
                     text="Clear temporary folder")
+        layout.prop(export_settings, "tight_bounding_spheres_bool",
+                    text="Tight bounding spheres")
 
 
 class ALBAM_PT_ToolsPanel(bpy.types.Panel):
@@ -1,4 +1,4 @@
-from .arc import Arc
+from .arc import Arc, ArcFiles, ArcWriter
 from .mod_156 import Mod156
 from ...engines.mtframework.tex import Tex112
 from .mappers import FILE_ID_TO_EXTENSION, EXTENSION_TO_FILE_ID
@@ -6,6 +6,8 @@ from .mappers import FILE_ID_TO_EXTENSION, EXTENSION_TO_FILE_ID
 
 __all__ = (
     'Arc',
+    'ArcFiles',
+    'ArcWriter',
     'Mod156',
     'Tex112',
     'FILE_ID_TO_EXTENSION',
@@ -1,12 +1,19 @@
+from collections import OrderedDict, deque, namedtuple
+from collections.abc import MutableMapping
+from concurrent.futures import ThreadPoolExecutor
 from ctypes import Structure, sizeof, c_int, c_uint, c_char, c_short, c_ubyte
+from fnmatch import fnmatchcase
+import mmap
 import ntpath
 import os
 import zlib
 
 from .mappers import FILE_ID_TO_EXTENSION, EXTENSION_TO_FILE_ID
+from ...lib.misc import ensure_ntpath, map_in_pool
 from ...lib.structure import DynamicStructure
 
 PADDING_SIZE = 32768
+STREAM_CHUNK_SIZE = 1 << 20
 
 
 class FileEntry(Structure):
@@ -21,6 +28,33 @@ class FileEntry(Structure):
                 )
 
 
+class ArcHeader(Structure):
+    _fields_ = (('id_magic', c_char * 4),
+                ('version', c_short),
+                ('files_count', c_short),
+                )
+
+
+def get_file_id(extension):
+    """File type id for `extension` (without the dot). Unknown types are stored as the number itself"""
+    try:
+        default = int(extension)
+    except ValueError:
+        default = 0
+    return EXTENSION_TO_FILE_ID.get(extension, default)
+
+
+def get_entry_path(file_entry):
+    """Path of the entry inside the arc, including the extension given by its file_id"""
+    file_extension = FILE_ID_TO_EXTENSION.get(file_entry.file_id) or str(file_entry.file_id)
+    return '.'.join((file_entry.file_path.decode('ascii'), file_extension))
+
+
+def normalize_entry_path(path):
+    """Case-insensitive ntpath used as key to look up entries, e.g. 'pawn\\pl\\pl02\\model\\pl0200.mod'"""
+    return ntpath.normcase(path).lstrip(ntpath.sep)
+
+
 def get_padding(size):
     return (PADDING_SIZE - size % PADDING_SIZE) % PADDING_SIZE
 
@@ -29,19 +63,99 @@ def get_padding_from_struct(tmp_struct):
     return get_padding(sizeof(tmp_struct))
 
 
-def get_data_length(tmp_struct, file_path=None):
-    if file_path:
-        try:
-            length = os.path.getsize(file_path) - sizeof(tmp_struct)
-        except TypeError:
-            # XXX: inefficient?
-            length = len(file_path.getbuffer()) - sizeof(tmp_struct)
+def get_data_length(tmp_struct, buff=None):
+    if buff is not None:
+        length = len(buff) - sizeof(tmp_struct)
     else:
         length = len(tmp_struct.data)
     return length
 
 
-class Arc(DynamicStructure):
+class ArcEntriesMixin:
+    """
+    Entry access shared by `Arc` and `ArcReader`, which provide `file_entries`,
+    `files_count`, `version` and `get_entry_data`.
+    """
+
+    @property
+    def entries_index(self):
+        """{normalized entry path: index in file_entries}. See `normalize_entry_path`"""
+        try:
+            return self._entries_index
+        except AttributeError:
+            self._entries_index = {normalize_entry_path(get_entry_path(self.file_entries[i])): i
+                                   for i in range(self.files_count)}
+            return self._entries_index
+
+    def get_entry_index(self, path_or_index):
+        if isinstance(path_or_index, int):
+            return path_or_index
+        try:
+            return self.entries_index[normalize_entry_path(path_or_index)]
+        except KeyError:
+            raise KeyError('Entry {} not found in arc'.format(path_or_index))
+
+    def read_entry(self, path_or_index):
+        """Decompress and return the data of a single entry, given its path in the arc or its index"""
+        index = self.get_entry_index(path_or_index)
+        with self.get_entry_data(index) as data:
+            return zlib.decompress(data)
+
+    def extract_entry(self, path_or_index, output_dir='.'):
+        index = self.get_entry_index(path_or_index)
+        fe = self.file_entries[index]
+        file_path = self._get_path(fe.file_path, fe.file_id, os.path.abspath(output_dir))
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, 'wb') as w:
+            w.write(self.read_entry(index))
+        return file_path
+
+    def extract(self, pattern, output_dir='.', workers=None):
+        """
+        Extract only the entries whose path matches the (case-insensitive) glob `pattern`,
+        e.g. '*.mod'. Return the paths of the extracted files.
+        """
+        pattern = normalize_entry_path(pattern)
+        indices = [i for path, i in self.entries_index.items() if fnmatchcase(path, pattern)]
+        return map_in_pool(lambda i: self.extract_entry(i, output_dir), indices, workers)
+
+    def unpack(self, output_dir='.', workers=None):
+        map_in_pool(lambda i: self.extract_entry(i, output_dir), range(self.files_count), workers)
+
+    def files(self):
+        """
+        `ArcFiles` with the entries of the arc. The compressed data is not copied nor
+        decompressed until an entry is read.
+        """
+        files = ArcFiles()
+        for i in range(self.files_count):
+            fe = self.file_entries[i]
+            files.add_compressed(get_entry_path(fe), fe, self.get_entry_data(i))
+        return files
+
+    def write_patched(self, file_path, replacements, workers=None):
+        """
+        Write a copy of the arc to `file_path` with the entries in `replacements`
+        ({entry path: bytes or binary file}) replaced, keeping their position, or added at
+        the end. The compressed data of the rest of entries is copied verbatim, so only
+        the replaced entries are compressed.
+        """
+        files = self.files()
+        for path in sorted(replacements, key=normalize_entry_path):
+            files[path] = replacements[path]
+        files.write(file_path, workers=workers, version=self.version)
+
+    @staticmethod
+    def _get_path(file_path, file_type_id, output_path):
+        file_extension = FILE_ID_TO_EXTENSION.get(file_type_id) or str(file_type_id)
+        file_path = file_path.decode('ascii')
+        file_path = '.'.join((file_path, file_extension))
+        parts = file_path.split(ntpath.sep)
+        file_path = os.path.join(output_path, *parts)
+        return file_path
+
+
+class Arc(ArcEntriesMixin, DynamicStructure):
     ID_MAGIC = b'ARC'
 
     _fields_ = (('id_magic', c_char * 4),
@@ -52,44 +166,33 @@ class Arc(DynamicStructure):
                 ('data', lambda s, f: c_ubyte * get_data_length(s, f)),
                 )
 
-    def unpack(self, output_dir='.'):
-        data = memoryview(self.data)
-        offset = 0
-        output_dir = os.path.abspath(output_dir)
-        for i in range(self.files_count):
-            fe = self.file_entries[i]
-            file_path = self._get_path(fe.file_path, fe.file_id, output_dir)
-            file_dir = os.path.dirname(file_path)
-            if not os.path.exists(file_dir):
-                os.makedirs(file_dir)
-            with open(file_path, 'wb') as w:
-                w.write(zlib.decompress(data[offset: offset + fe.zsize]))
-            offset += fe.zsize
+    @classmethod
+    def open(cls, file_path, mmap=True):
+        """
+        Parse only the header and the file entries of the arc in `file_path`.
+        The data of each entry is exposed lazily; see `ArcReader`.
+        """
+        return ArcReader(file_path, use_mmap=mmap)
+
+    def get_entry_data(self, index):
+        """Zero-copy view of the compressed data of the entry at `index`"""
+        fe = self.file_entries[index]
+        return memoryview(self).cast('B')[fe.offset: fe.offset + fe.zsize]
 
     @classmethod
-    def from_dir(cls, source_path):
-        file_paths = {os.path.join(root, f) for root, _, files in os.walk(source_path)
-                      for f in files}
-        files_count = len(file_paths)
+    def from_files(cls, files, workers=None):
+        """Build an arc in memory from an `ArcFiles`, compressing the entries that aren't yet"""
+        files_count = len(files)
         file_entries = (FileEntry * files_count)()
         size_so_far = 8 + sizeof(file_entries)
         padding = get_padding(size_so_far)
         current_offset = size_so_far + padding
         data = bytearray()
-        for i, file_path in enumerate(sorted(file_paths)):
-            with open(file_path, 'rb') as f:
-                chunk = zlib.compress(f.read())
+        chunks = map_in_pool(files.get_compressed, files, workers)
+        for i, (file_entry, chunk) in enumerate(chunks):
             data.extend(chunk)
-            ext = os.path.splitext(file_path)[1].replace('.', '')
-            try:
-                default = int(ext)
-            except ValueError:
-                default = 0
-            file_entries[i] = FileEntry(file_path=cls._set_path(source_path, file_path),
-                                        file_id=EXTENSION_TO_FILE_ID.get(ext, default),
-                                        flags=2,  # always compressing
-                                        size=os.path.getsize(file_path),
-                                        zsize=len(chunk), offset=current_offset)
+            file_entries[i] = file_entry
+            file_entries[i].offset = current_offset
             current_offset += len(chunk)
 
         data = (c_ubyte * len(data)).from_buffer(data)
@@ -101,14 +204,9 @@ class Arc(DynamicStructure):
             data=data
         )
 
-    @staticmethod
-    def _get_path(file_path, file_type_id, output_path):
-        file_extension = FILE_ID_TO_EXTENSION.get(file_type_id) or str(file_type_id)
-        file_path = file_path.decode('ascii')
-        file_path = '.'.join((file_path, file_extension))
-        parts = file_path.split(ntpath.sep)
-        file_path = os.path.join(output_path, *parts)
-        return file_path
+    @classmethod
+    def from_dir(cls, source_path, workers=None):
+        return cls.from_files(ArcFiles.from_dir(source_path), workers)
 
     @staticmethod
     def _set_path(source_path, file_path):
@@ -117,3 +215,317 @@ class Arc(DynamicStructure):
         file_path = os.path.splitext(file_path)[0]
         parts = file_path.split(os.path.sep)
         return ntpath.join('', *parts).encode('ascii')
+
+
+SourceFile = namedtuple('SourceFile', ('path',))
+CompressedData = namedtuple('CompressedData', ('file_entry', 'zdata'))
+
+
+class ArcFiles(MutableMapping):
+    """
+    In-memory model of the contents of an arc: {entry path: data}, in the order of the arc.
+    Entry paths are looked up case-insensitively, either in nt or posix format.
+    Data is only loaded when needed: entries taken from an arc keep their compressed data
+    (see `Arc.files`) and entries from a directory are read when written.
+    Replacing an entry keeps its position and its file_id; new entries are added at the end.
+
+        files = arc.files()
+        files['pawn\\pl\\pl02\\model\\pl0200.mod'] = mod_data
+        files.write('out.arc')
+    """
+
+    def __init__(self, entries=()):
+        self._entries = OrderedDict()  # {normalized path: (entry path, file_id, source)}
+        self.update(entries)
+
+    def __getitem__(self, path):
+        _, _, source = self._get(path)
+        if isinstance(source, CompressedData):
+            return zlib.decompress(source.zdata)
+        elif isinstance(source, SourceFile):
+            with open(source.path, 'rb') as f:
+                return f.read()
+        return source
+
+    def __setitem__(self, path, data):
+        """`data` is a bytes-like object with the uncompressed contents of the entry"""
+        key = normalize_entry_path(ensure_ntpath(path))
+        try:
+            path, file_id, _ = self._entries[key]
+        except KeyError:
+            path, file_id = self._new_entry(path)
+        self._entries[key] = (path, file_id, data)
+
+    def __delitem__(self, path):
+        del self._entries[self._get_key(path)]
+
+    def __iter__(self):
+        return (path for path, _, _ in self._entries.values())
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, path):
+        return normalize_entry_path(ensure_ntpath(path)) in self._entries
+
+    def add_compressed(self, path, file_entry, zdata):
+        """Add an entry whose data is already compressed, e.g. a view from another arc"""
+        key = normalize_entry_path(ensure_ntpath(path))
+        path, _ = self._new_entry(path)
+        self._entries[key] = (path, file_entry.file_id, CompressedData(file_entry, zdata))
+
+    def add_file(self, path, source_path):
+        """Add an entry read from `source_path` only when needed"""
+        key = normalize_entry_path(ensure_ntpath(path))
+        path, file_id = self._new_entry(path)
+        self._entries[key] = (path, file_id, SourceFile(source_path))
+
+    def get_compressed(self, path):
+        """Return a `FileEntry` without offset and the compressed data of the entry at `path`"""
+        path, file_id, source = self._get(path)
+        if isinstance(source, CompressedData):
+            fe = source.file_entry
+            return (FileEntry(file_path=fe.file_path, file_id=fe.file_id, size=fe.size,
+                              flags=fe.flags, zsize=fe.zsize),
+                    source.zdata)
+        data = self[path]
+        zdata = zlib.compress(data)
+        file_path = ntpath.splitext(path)[0].encode('ascii')
+        return (FileEntry(file_path=file_path, file_id=file_id, flags=2,  # always compressing
+                          size=len(data), zsize=len(zdata)),
+                zdata)
+
+    def write(self, file_path, workers=None, version=7):
+        """Serialize to an arc file, only compressing the entries that aren't yet"""
+        with ArcWriter(file_path, len(self), workers=workers, version=version) as writer:
+            for path, file_id, source in self._entries.values():
+                if isinstance(source, CompressedData):
+                    writer.add_compressed(source.file_entry, source.zdata)
+                elif isinstance(source, SourceFile):
+                    with open(source.path, 'rb') as f:
+                        writer.add(path, f, file_id=file_id)
+                else:
+                    writer.add(path, source, file_id=file_id)
+
+    @classmethod
+    def from_dir(cls, source_path):
+        arc_files = cls()
+        file_paths = sorted({os.path.join(root, f) for root, _, files in os.walk(source_path)
+                             for f in files})
+        for file_path in file_paths:
+            ext = os.path.splitext(file_path)[1]
+            arc_files.add_file(Arc._set_path(source_path, file_path).decode('ascii') + ext, file_path)
+        return arc_files
+
+    def _get_key(self, path):
+        key = normalize_entry_path(ensure_ntpath(path))
+        if key not in self._entries:
+            raise KeyError('Entry {} not found in arc'.format(path))
+        return key
+
+    def _get(self, path):
+        return self._entries[self._get_key(path)]
+
+    @staticmethod
+    def _new_entry(path):
+        path = ensure_ntpath(path).lstrip(ntpath.sep)
+        return path, get_file_id(ntpath.splitext(path)[1].replace('.', ''))
+
+
+class ArcReader(ArcEntriesMixin):
+    """
+    Read-only view of an arc file that doesn't load the data into memory.
+    Only the header and the file entries are parsed and copied; the
+    compressed data of each entry is a memoryview over a memory-mapped file
+    (or over the file contents if `use_mmap` is False).
+    Views returned by `get_entry_data` should be released before closing,
+    otherwise the mapping stays open until they are garbage collected.
+    """
+
+    def __init__(self, file_path, use_mmap=True):
+        self.file_path = file_path
+        self._file = open(file_path, 'rb')
+        try:
+            if use_mmap:
+                self._buffer = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self._buffer = self._file.read()
+            self.header = ArcHeader.from_buffer_copy(self._buffer)
+            entries_cls = FileEntry * self.header.files_count
+            self.file_entries = entries_cls.from_buffer_copy(self._buffer, sizeof(ArcHeader))
+        except Exception:
+            self._file.close()
+            raise
+        self._view = memoryview(self._buffer)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.files_count
+
+    def __iter__(self):
+        for i in range(self.files_count):
+            yield self.file_entries[i], self.get_entry_data(i)
+
+    @property
+    def id_magic(self):
+        return self.header.id_magic
+
+    @property
+    def version(self):
+        return self.header.version
+
+    @property
+    def files_count(self):
+        return self.header.files_count
+
+    def get_entry_data(self, index):
+        """Zero-copy view of the compressed data of the entry at `index`"""
+        fe = self.file_entries[index]
+        return self._view[fe.offset: fe.offset + fe.zsize]
+
+    def close(self):
+        if self._file.closed:
+            return
+        try:
+            self._view.release()
+            if isinstance(self._buffer, mmap.mmap):
+                self._buffer.close()
+        except BufferError:
+            # entry views are still alive, e.g. referenced from a traceback;
+            # the mapping is closed once they are garbage collected
+            pass
+        finally:
+            self._view = None
+            self._buffer = None
+            self._file.close()
+
+
+class ArcWriter:
+    """
+    Write an arc to `file_path` without holding it in memory.
+    A placeholder header and file entry table for `files_count` entries is
+    written first, compressed entries are streamed to the file as they are
+    added, and the table is patched on close. With `workers` > 1 entries are
+    compressed in a thread pool while keeping the order they were added in.
+    The arc is written to a temporary file next to `file_path` that only replaces
+    it once complete, so a failed write leaves the previous file untouched.
+
+        with ArcWriter('out.arc', len(paths)) as writer:
+            for path in paths:
+                with open(path, 'rb') as f:
+                    writer.add('pawn\\pl\\pl02\\model\\pl0200.mod', f)
+    """
+
+    def __init__(self, file_path, files_count, workers=None, version=7):
+        self.header = ArcHeader(id_magic=Arc.ID_MAGIC, version=version, files_count=files_count)
+        self.file_entries = (FileEntry * files_count)()
+        self._count = 0
+        size_so_far = sizeof(self.header) + sizeof(self.file_entries)
+        self._offset = size_so_far + get_padding(size_so_far)
+        self._pending = deque()
+        if workers and workers > 1:
+            self._executor = ThreadPoolExecutor(max_workers=workers)
+            self._max_pending = workers * 2
+        else:
+            self._executor = None
+        self.file_path = file_path
+        self._tmp_path = file_path + '.tmp'
+        self._file = open(self._tmp_path, 'wb')
+        self._file.write(bytes(self._offset))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._abort()
+
+    def add(self, path, data, file_id=None):
+        """
+        Add an entry. `path` is the path inside the arc including the extension,
+        either in nt or posix format; `data` is a bytes-like object or a binary file.
+        `file_id` overrides the one derived from the extension.
+        """
+        if self._count + len(self._pending) >= self.header.files_count:
+            raise ValueError('More entries added than the {} reserved'.format(self.header.files_count))
+        file_path, ext = ntpath.splitext(ensure_ntpath(path))
+        file_path = file_path.lstrip(ntpath.sep).encode('ascii')
+        if file_id is None:
+            file_id = get_file_id(ext.replace('.', ''))
+        if self._executor:
+            if hasattr(data, 'read'):
+                data = data.read()
+            future = self._executor.submit(zlib.compress, data)
+            self._pending.append((file_path, file_id, len(data), future))
+            while len(self._pending) > self._max_pending:
+                self._write_pending()
+        elif hasattr(data, 'read'):
+            self._write_stream(file_path, file_id, data)
+        else:
+            self._write_entry(file_path, file_id, len(data), zlib.compress(data))
+
+    def add_compressed(self, file_entry, zdata):
+        """Add the already compressed data of `file_entry` from another arc, keeping its metadata"""
+        if self._count + len(self._pending) >= self.header.files_count:
+            raise ValueError('More entries added than the {} reserved'.format(self.header.files_count))
+        while self._pending:
+            self._write_pending()
+        self._write_entry(file_entry.file_path, file_entry.file_id, file_entry.size, zdata, file_entry.flags)
+
+    def close(self):
+        try:
+            while self._pending:
+                self._write_pending()
+            if self._count != self.header.files_count:
+                raise ValueError('{} entries added to an arc of {}'.format(self._count, self.header.files_count))
+            self._file.seek(0)
+            self._file.write(self.header)
+            self._file.write(self.file_entries)
+            self._shutdown()
+            os.replace(self._tmp_path, self.file_path)
+        except BaseException:
+            self._abort()
+            raise
+
+    def _abort(self):
+        self._shutdown()
+        try:
+            os.remove(self._tmp_path)
+        except OSError:
+            pass
+
+    def _shutdown(self):
+        self._pending.clear()
+        if self._executor:
+            self._executor.shutdown()
+        self._file.close()
+
+    def _write_pending(self):
+        file_path, file_id, size, future = self._pending.popleft()
+        self._write_entry(file_path, file_id, size, future.result())
+
+    def _write_stream(self, file_path, file_id, f):
+        compressor = zlib.compressobj()
+        size = zsize = 0
+        for chunk in iter(lambda: f.read(STREAM_CHUNK_SIZE), b''):
+            size += len(chunk)
+            zsize += self._file.write(compressor.compress(chunk))
+        zsize += self._file.write(compressor.flush())
+        self._add_file_entry(file_path, file_id, size, zsize)
+
+    def _write_entry(self, file_path, file_id, size, zdata, flags=2):
+        self._file.write(zdata)
+        self._add_file_entry(file_path, file_id, size, len(zdata), flags)
+
+    def _add_file_entry(self, file_path, file_id, size, zsize, flags=2):
+        self.file_entries[self._count] = FileEntry(file_path=file_path, file_id=file_id, flags=flags,
+                                                   size=size, zsize=zsize, offset=self._offset)
+        self._offset += zsize
+        self._count += 1
@@ -1,15 +1,12 @@
 from collections import OrderedDict, namedtuple
 import ctypes
-from io import BytesIO
 from itertools import chain
-import math
 import ntpath
 import os
-import tempfile
 
 try:
     import bpy
-    import mathutils
+    import numpy as np
 except ImportError:
     pass
 
@@ -25,26 +22,30 @@ from ...engines.mtframework.mod_156 import (
     )
 from ...engines.mtframework import Arc, Mod156, Tex112
 from ...engines.mtframework.utils import (
-    vertices_export_locations,
+    get_vertex_dtype,
     blender_texture_to_texture_code,
     get_texture_dirs,
     get_default_texture_dir,
     )
-from ...lib.half_float import pack_half_float
+from ...lib.bounds import get_bounding_box, get_bounding_sphere, get_distances, get_oriented_bounding_boxes
+from ...lib.half_float import pack_half_floats
 from ...lib.structure import get_offset
-from ...lib.geometry import z_up_to_y_up
-from ...lib.misc import ntpath_to_os_path
 from ...lib.blender import (
     triangles_list_to_triangles_strip,
+    get_loop_vertex_indices,
+    get_first_loop_per_vertex,
+    get_per_vertex_from_loops,
+    get_uvs_per_vertex,
     get_textures_from_the_material,
     get_textures_from_blender_objects,
     get_materials_from_blender_objects,
     get_vertex_count_from_blender_objects,
-    get_bone_indices_and_weights_per_vertex,
-    get_uvs_per_vertex,
+    get_bone_weights_per_vertex,
     BoundingBox,
     get_model_bounding_box,
     get_model_bounding_sphere,
+    get_model_vertex_coordinates,
+    get_vertex_coordinates,
 )
 
 try:
@@ -69,7 +70,7 @@ def export_arc(blender_object, file_path):
         blender_object : bpy.data.objects['uPl02JillCos1.arc']
         file_path : full path to .ars
     '''
-    saved_arc = Arc(file_path=BytesIO(blender_object.albam_imported_item.data))  # <albam_reloaded.engines.mtframework.arc.GenArc object
+    saved_arc = Arc.from_buffer(blender_object.albam_imported_item.data)  # <albam_reloaded.engines.mtframework.arc.GenArc object
 
     mods = {}
     texture_dirs = {}
@@ -85,57 +86,50 @@ def export_arc(blender_object, file_path):
         texture_dirs.update(exported_mod.exported_materials.texture_dirs)  # path inside arc 'pawn\\pl\\pl02\\model'
         textures_to_export.extend(exported_mod.exported_materials.blender_textures)
 
-    with tempfile.TemporaryDirectory() as tmpdir:
-        saved_arc.unpack(tmpdir)
+    arc_files = saved_arc.files()  # {entry path in the arc: data}, read lazily
 
-        mod_files = [os.path.join(root, f) for root, _, files in os.walk(tmpdir)
-                     for f in files if f.endswith('.mod')]
+    # overwriting the original mod files with the exported ones
+    for entry_path in list(arc_files):
+        if not entry_path.endswith('.mod'):
+            continue
+        filename = ntpath.basename(entry_path)
+        try:
+            # TODO: mods with the same name in different folders
+            exported_mod = mods[filename]
+        except:
+            if (bpy.context.scene.albam_export_settings.ignore_missing_mod_bool):
+                print(f"Ignoring missing mod file in Blender: {filename}")
+                continue
+            else:
+                raise ExportError("Can't export to arc, a mod file is missing: {}. "
+                                "Was it deleted before exporting?. "
+                                "mods.items(): {}".format(filename, mods.items()))
+
+        arc_files[entry_path] = bytes(exported_mod.mod)
+
+    for blender_texture in textures_to_export:
+        texture_name = blender_texture.name
+        tex_file_path = bpy.path.abspath(blender_texture.image.filepath)
+        tex_filename_no_ext = os.path.splitext(os.path.basename(tex_file_path))[0]
+        entry_path = ntpath.join(texture_dirs[texture_name], tex_filename_no_ext + '.tex')
+        tex = Tex112.from_dds(file_path=bpy.path.abspath(blender_texture.image.filepath))
+        # metadata saved
+        # TODO: use an util function
+        for field in tex._fields_:
+            attr_name = field[0]
+            if not attr_name.startswith('unk_'):
+                continue
+            setattr(tex, attr_name, getattr(blender_texture, attr_name))
 
-        # overwriting the original mod files with the exported ones
-        for modf in mod_files:
-            filename = os.path.basename(modf)
-            try:
-                # TODO: mods with the same name in different folders
-                exported_mod = mods[filename]
-            except:
-                if (bpy.context.scene.albam_export_settings.ignore_missing_mod_bool):
-                    print(f"Ignoring missing mod file in Blender: {filename}")
-                    continue
-                else:
-                    raise ExportError("Can't export to arc, a mod file is missing: {}. "
-                                    "Was it deleted before exporting?. "
-                                    "mods.items(): {}".format(filename, mods.items()))
-
-            with open(modf, 'wb') as w:
-                w.write(exported_mod.mod)
-
-        for blender_texture in textures_to_export:
-            texture_name = blender_texture.name
-            resolved_path = ntpath_to_os_path(texture_dirs[texture_name])
-            tex_file_path = bpy.path.abspath(blender_texture.image.filepath)
-            tex_filename_no_ext = os.path.splitext(os.path.basename(tex_file_path))[0]
-            destination_path = os.path.join(tmpdir, resolved_path, tex_filename_no_ext + '.tex')
-            tex = Tex112.from_dds(file_path=bpy.path.abspath(blender_texture.image.filepath))
-            # metadata saved
-            # TODO: use an util function
-            for field in tex._fields_:
-                attr_name = field[0]
-                if not attr_name.startswith('unk_'):
-                    continue
-                setattr(tex, attr_name, getattr(blender_texture, attr_name))
-
-            with open(destination_path, 'wb') as w:
-                w.write(tex)
-
-        # Once the textures and the mods have been replaced, repack.
-        new_arc = Arc.from_dir(tmpdir)
-
-    with open(file_path, 'wb') as w:
-        w.write(new_arc)
+        arc_files[entry_path] = bytes(tex)
+
+    # Once the textures and the mods have been replaced, repack.
+    # Only the replaced entries are compressed again
+    arc_files.write(file_path, workers=os.cpu_count(), version=saved_arc.version)
 
 
 def export_mod156(parent_blender_object):
-    saved_mod = Mod156(file_path=BytesIO(parent_blender_object.albam_imported_item.data))
+    saved_mod = Mod156.from_buffer(parent_blender_object.albam_imported_item.data)
 
     first_children = [child for child in parent_blender_object.children]
     blender_meshes = [c for c in first_children if c.type == 'MESH']
@@ -174,15 +168,17 @@ def export_mod156(parent_blender_object):
         bone_palettes = {}
         bone_palette_array = (BonePalette * 0)()
 
-    bl_bbox = get_model_bounding_box(blender_meshes)
+    tight_bounding_spheres = bpy.context.scene.albam_export_settings.tight_bounding_spheres_bool
+    vertex_coordinates = get_model_vertex_coordinates(blender_meshes)
+    bl_bbox = get_model_bounding_box(blender_meshes, vertex_coordinates)
     bbox = BoundingBox(
             bl_bbox.min_x * 100, bl_bbox.min_z * 100, -bl_bbox.max_y * 100,
             bl_bbox.max_x * 100, bl_bbox.max_z * 100, -bl_bbox.min_y * 100
     )
-    bl_bsphere = get_model_bounding_sphere(blender_meshes)
+    bl_bsphere = get_model_bounding_sphere(blender_meshes, vertex_coordinates, tight=tight_bounding_spheres)
     bsphere = bl_bsphere[0] * 100, bl_bsphere[2] * 100, -bl_bsphere[1] * 100, bl_bsphere[3] * 100
     exported_materials = _export_textures_and_materials(blender_meshes, saved_mod)
-    exported_meshes = _export_meshes(blender_meshes, bone_palettes, exported_materials, bbox)
+    exported_meshes = _export_meshes(blender_meshes, bone_palettes, exported_materials, bbox, tight_bounding_spheres)
 
     mod = Mod156(id_magic=b'MOD',
                  version=156,
@@ -251,184 +247,237 @@ def export_mod156(parent_blender_object):
 
 
 def _get_vertex_colours(blender_mesh):
+    """
+    Return a (vertex_count, 4) int array with the (r, g, b, a) bytes of the first color layer,
+    taking the color of the last loop of each vertex, and a mask of the vertices that have one
+    (i.e. that are used by a loop). None if there are no colors.
+    """
     mesh = blender_mesh.data
-    colors = {}
     try:
         color_layer = mesh.vertex_colors[0]
     except:
-        return colors
-    mesh_loops = {li: loop.vertex_index for li, loop in enumerate(mesh.loops)}
-    vtx_colors = {mesh_loops[li]: data.color for li, data in color_layer.data.items()}
-    for idx, color in vtx_colors.items():
-        b = round(color[0]*255)
-        g = round(color[1]*255)
-        r = round(color[2]*255)
-        a = round(color[3]*255)
-        colors[idx] = (r, g, b, a)
-    return colors
-
-
-def _process_weights(weights_per_vertex, max_bones_per_vertex=4):
+        return None
+    loop_vertex_indices = get_loop_vertex_indices(mesh)
+    loop_colors = np.empty(len(loop_vertex_indices) * 4, dtype=np.float32)
+    color_layer.data.foreach_get('color', loop_colors)
+    loop_colors = np.rint(loop_colors.reshape(-1, 4).astype(np.float64) * 255).astype(np.int64)
+
+    # the color of the last loop of each vertex
+    vertex_indices, reversed_loops = np.unique(loop_vertex_indices[::-1], return_index=True)
+    last_loops = len(loop_vertex_indices) - 1 - reversed_loops
+    colors = np.zeros((len(mesh.vertices), 4), dtype=np.int64)
+    colors[vertex_indices] = loop_colors[last_loops][:, (2, 1, 0, 3)]
+    has_color = np.zeros(len(mesh.vertices), dtype=bool)
+    has_color[vertex_indices] = True
+    return colors, has_color
+
+
+def _process_weights(bone_indices, weights, has_groups, max_bones_per_vertex=4):
     """
-    Given a dict `weights_per_vertex` with vertex_indices as keys and
-    a list of tuples (bone_index, weight_value), iterate over values
-    and process them to make them mtframework friendly:
+    Given the dense (vertex_count, K) `bone_indices` and `weights` from
+    `get_bone_weights_per_vertex`, process them to make them mtframework friendly:
     1) Limit bone weights: keep only up to `max_bones` elements, discarding the pairs that have the
        lowest influence. This is actually a limitation in albam for lack of
        understanding on how the engine treats vertices with more than 4 bone influencing it
     2) Normalize weights: make all weights sum up 1
     3) float to byte: convert the (-1.0, 1.0) to (0, 255)
+    Return (vertex_count, bones) arrays with the bone indices (-1 as padding) and byte weights,
+    `bones` being the most influences a vertex has after the limit.
     """
     # TODO: move to mtframework.utils
-    new_weights_per_vertex = {}
     limit = max_bones_per_vertex
-    for vertex_index, influence_list in weights_per_vertex.items():
-        # limit max bones
-        if len(influence_list) > limit:
-            influence_list = sorted(influence_list, key=lambda t: t[1])[-limit:]
-
-        # normalize
-        weights = [t[1] for t in influence_list]
-        bone_indices = [t[0] for t in influence_list]
-        total_weight = sum(weights)
-        if total_weight:
-            weights = [(w / total_weight) for w in weights]
-
-        # float to byte
-        weights = [round(w * 255) or 1 for w in weights]  # can't have zero values
-        # correct precision
-        excess = sum(weights) - 255
-        if not len(weights):
-            raise ExportError("There are vertices with zero weights")
-        if excess:
-            max_index, _ = max(enumerate(weights), key=lambda p: p[1])
-            weights[max_index] -= excess
-
-        new_weights_per_vertex[vertex_index] = list(zip(bone_indices, weights))
-
-    return new_weights_per_vertex
-
-
-def _get_normals_per_vertex(blender_mesh):
-    normals = {}
-
+    vertex_count = len(bone_indices)
+    influence_counts = (bone_indices != -1).sum(axis=1)
+    if (has_groups & (influence_counts == 0)).any():
+        raise ExportError("There are vertices with zero weights")
+    bones = min(influence_counts.max(initial=0), limit)
+
+    # limit max bones: vertices with too many keep the highest `limit` weights, lowest first.
+    # A stable sort rather than argpartition, ties have to be broken the same on every export
+    columns = np.broadcast_to(np.arange(bones), (vertex_count, bones))
+    too_many = influence_counts > limit
+    if too_many.any():
+        sort_weights = np.where(bone_indices[too_many] != -1, weights[too_many], -np.inf)
+        columns = columns.copy()
+        columns[too_many] = np.argsort(sort_weights, axis=1, kind='stable')[:, -limit:]
+    bone_indices = np.take_along_axis(bone_indices, columns, axis=1)
+    weights = np.take_along_axis(weights, columns, axis=1)
+    valid = bone_indices != -1
+
+    # normalize, adding the columns in order so the sums are the same as sum()
+    total_weight = np.zeros(vertex_count)
+    for column in weights.T:
+        total_weight += column
+    weights = np.divide(weights, total_weight[:, None], out=weights.copy(), where=total_weight[:, None] != 0)
+
+    # float to byte
+    weights = np.rint(weights * 255).astype(np.int64)
+    weights[valid & (weights == 0)] = 1  # can't have zero values
+    weights[~valid] = 0
+    # correct precision: the excess goes to the first of the highest weights
+    if bones:
+        excess = weights.sum(axis=1) - 255
+        max_columns = np.where(valid, weights, np.iinfo(np.int64).min).argmax(axis=1)
+        corrected = valid.any(axis=1)
+        weights[corrected, max_columns[corrected]] -= excess[corrected]
+
+    return bone_indices, weights
+
+
+def _get_normals_per_vertex(blender_mesh, first_loops):
+    """(vertex_count, 3) normals, NaN for the vertices without one"""
     if blender_mesh.has_custom_normals:
         blender_mesh.calc_normals_split()
-        for loop in blender_mesh.loops:
-            normals.setdefault(loop.vertex_index, loop.normal)
-    else:
-        for vertex in blender_mesh.vertices:
-            normals[vertex.index] = vertex.normal
-    return normals
+        loop_normals = np.empty(len(blender_mesh.loops) * 3, dtype=np.float32)
+        blender_mesh.loops.foreach_get('normal', loop_normals)
+        return get_per_vertex_from_loops(loop_normals.reshape(-1, 3), first_loops, np.nan)
+    normals = np.empty(len(blender_mesh.vertices) * 3, dtype=np.float32)
+    blender_mesh.vertices.foreach_get('normal', normals)
+    return normals.reshape(-1, 3)
 
 
-def _get_tangents_per_vertex(blender_mesh):
-    tangents = {}
+def _get_tangents_per_vertex(blender_mesh, first_loops):
+    """(vertex_count, 3) tangents, NaN for the vertices without one"""
     try:
         uv_name = blender_mesh.uv_layers[0].name
     except IndexError:
         uv_name = ''
     blender_mesh.calc_tangents(uvmap=uv_name)
-    for loop in blender_mesh.loops:
-        tangents.setdefault(loop.vertex_index, loop.tangent)
-    return tangents
-
-
-def _pack_uv(uv_array):
-    packed_uv = uv_array
-    for vertex_index, (uv_x, uv_y) in uv_array.items():
-        # flipping for dds textures
-        uv_y = (uv_y - 1.0)
-        uv_y = round(uv_y, 4)
-        uv_y *= -1
-        if uv_y == -0.0:
-            uv_y = 0.0
-        uv_x = pack_half_float(uv_x)
-        uv_y = pack_half_float(uv_y)
-        packed_uv[vertex_index] = (uv_x, uv_y)
-    return packed_uv
+    loop_tangents = np.empty(len(blender_mesh.loops) * 3, dtype=np.float32)
+    blender_mesh.loops.foreach_get('tangent', loop_tangents)
+    return get_per_vertex_from_loops(loop_tangents.reshape(-1, 3), first_loops, np.nan)
+
+
+def _pack_uv(uvs):
+    """
+    Flip (for dds textures) and pack as half floats the (uvs, has_uv) given by `get_uvs_per_vertex`,
+    vertices without uvs get (0, 0)
+    """
+    uvs, has_uv = uvs
+    uvs = uvs.astype(np.float64)
+    # round(, 4) on values with at most 24 significant bits: same results as the builtin round()
+    uvs[:, 1] = np.round(uvs[:, 1] - 1.0, 4) * -1 + 0.0  # + 0.0: no -0.0
+    packed_uvs = np.zeros((len(uvs), 2), dtype=np.uint16)
+    packed_uvs[has_uv] = pack_half_floats(uvs[has_uv]).reshape(-1, 2)
+    return packed_uvs
+
+
+def _get_bone_indices_and_weights(bone_indices, weight_values, bones_per_vertex, bone_palette):
+    """
+    Dense (vertex_count, bones_per_vertex) arrays with the bone palette indices and the
+    weight values of each vertex from the ones given by `_process_weights`, padded with zeros
+    """
+    vertex_count, bones = bone_indices.shape
+    valid = bone_indices != -1
+    palette = np.array(bone_palette, dtype=np.int64)
+    lookup = np.full(max(palette.max(initial=-1), bone_indices.max(initial=-1)) + 1, -1, dtype=np.int64)
+    unique_bones, first_positions = np.unique(palette, return_index=True)
+    lookup[unique_bones] = first_positions  # first occurrence, like list.index()
+    palette_indices = np.where(valid, lookup[bone_indices], 0)
+    if (palette_indices == -1).any():
+        raise ExportError('Vertex weights use bones not in the bone palette')
+
+    padded_bone_indices = np.zeros((vertex_count, bones_per_vertex), dtype=np.int64)
+    padded_weight_values = np.zeros((vertex_count, bones_per_vertex), dtype=np.int64)
+    padded_bone_indices[:, :bones] = palette_indices
+    padded_weight_values[:, :bones] = weight_values
+    return padded_bone_indices, padded_weight_values
+
+
+def _quantize_normals(normals, tangents, missing_normals, missing_tangents, mesh_index):
+    """
+    Normals and tangents from [-1, 1] to [0, 255], swapping y and z.
+    Like the original per vertex export, once a value is missing or not finite
+    it and the rest of the vertex values are left as 0.
+    """
+    values = np.concatenate((normals[:, (0, 2, 1)], tangents[:, (0, 2, 1)]), axis=1).astype(np.float64)
+    values *= (0.5, 0.5, -0.5, 0.5, 0.5, -0.5)
+    values = (values + 0.5) * 255
+    is_valid = np.isfinite(values)
+    first_invalid = np.where(is_valid.all(axis=1), values.shape[1], np.argmin(is_valid, axis=1))
+    keep = np.arange(values.shape[1]) < first_invalid[:, None]
+    quantized = np.where(keep, np.rint(np.where(is_valid, values, 0)), 0).astype(np.int64)
+
+    missing = np.where(first_invalid < 3, missing_normals, missing_tangents) & (first_invalid < values.shape[1])
+    for vertex_index in np.flatnonzero(missing).tolist():
+        # should not happen. TODO: investigate cases where it did happen
+        print('Missing normal in vertex {}, mesh {}'.format(vertex_index, mesh_index))
+    return quantized
 
 
 def _export_vertices(blender_mesh_object, mesh_index, bone_palette, model_bounding_box):
     blender_mesh = blender_mesh_object.data
     vtx_color_flag = blender_mesh.materials[0].unk_flag_8_bones_vertex
     vertex_count = len(blender_mesh.vertices)
-    uvs_per_vertex = get_uvs_per_vertex(blender_mesh_object, 0)
-    uvs_lmap_per_vertex = get_uvs_per_vertex(blender_mesh_object, 1)
+    first_loops = get_first_loop_per_vertex(blender_mesh)
+    uvs_per_vertex = get_uvs_per_vertex(blender_mesh, 0, first_loops)
+    uvs_lmap_per_vertex = get_uvs_per_vertex(blender_mesh, 1, first_loops)
     colors_per_vertex = _get_vertex_colours(blender_mesh_object)
-    weights_per_vertex = get_bone_indices_and_weights_per_vertex(blender_mesh_object)
-    weights_per_vertex = _process_weights(weights_per_vertex)
-    max_bones_per_vertex = max({len(data) for data in weights_per_vertex.values()}, default=0)
-    normals = _get_normals_per_vertex(blender_mesh)
-    tangents = _get_tangents_per_vertex(blender_mesh)
+    bone_indices, weight_values = _process_weights(*get_bone_weights_per_vertex(blender_mesh_object))
+    max_bones_per_vertex = bone_indices.shape[1]
+    normals = _get_normals_per_vertex(blender_mesh, first_loops)
+    tangents = _get_tangents_per_vertex(blender_mesh, first_loops)
 
     VF = VERTEX_FORMATS_TO_CLASSES[max_bones_per_vertex]
+    vertices = np.zeros(vertex_count, dtype=get_vertex_dtype(VF))
+    fields = vertices.dtype.names
+    has_bones = 'bone_indices' in fields
+
+    # y up, in the bounding box for skinned meshes
+    co = np.empty(vertex_count * 3, dtype=np.float32)
+    blender_mesh.vertices.foreach_get('co', co)
+    xyz = co.reshape(-1, 3).astype(np.float64) * 100
+    xyz = xyz[:, (0, 2, 1)] * (1, 1, -1)
+    if has_bones:
+        box_min = np.array((model_bounding_box.min_x, model_bounding_box.min_y, model_bounding_box.min_z))
+        box_max = np.array((model_bounding_box.max_x, model_bounding_box.max_y, model_bounding_box.max_z))
+        xyz = np.rint((xyz - box_min) / (box_max - box_min) * 32767).astype(np.int64)
+        bones_per_vertex = vertices.dtype['bone_indices'].shape[0]
+        bone_indices, weight_values = _get_bone_indices_and_weights(bone_indices, weight_values,
+                                                                    bones_per_vertex, bone_palette)
+        vertices['bone_indices'] = bone_indices.astype(np.uint8)
+        vertices['weight_values'] = weight_values.astype(np.uint8)
+        vertices['position_w'] = 32767
+    for i, axis in enumerate('xyz'):
+        vertices['position_' + axis] = xyz[:, i].astype(vertices.dtype['position_' + axis])
+
+    missing_tangents = first_loops == -1
+    missing_normals = missing_tangents if blender_mesh.has_custom_normals else np.zeros(vertex_count, dtype=bool)
+    quantized = _quantize_normals(normals, tangents, missing_normals, missing_tangents, mesh_index).astype(np.uint8)
+    for i, name in enumerate(('normal_x', 'normal_y', 'normal_z', 'tangent_x', 'tangent_y', 'tangent_z')):
+        if name in fields:
+            vertices[name] = quantized[:, i]
+    vertices['normal_w'] = 255
+    if 'tangent_w' in fields:
+        vertices['tangent_w'] = 255
+
+    if uvs_per_vertex:
+        packed_uvs = _pack_uv(uvs_per_vertex)
+        vertices['uv_x'] = packed_uvs[:, 0]
+        vertices['uv_y'] = packed_uvs[:, 1]
+    if 'uv2_x' in fields:
+        if uvs_lmap_per_vertex:
+            packed_uvs_lmap = _pack_uv(uvs_lmap_per_vertex)
+            vertices['uv2_x'] = packed_uvs_lmap[:, 0]
+            vertices['uv2_y'] = packed_uvs_lmap[:, 1]
+        else:
+            vertices['uv2_x'] = 65535
+            vertices['uv2_y'] = 65535
+    # export vertex colors
+    if max_bones_per_vertex == 0:
+        if vtx_color_flag == 1:
+            colors = np.full((vertex_count, 4), 255, dtype=np.int64)
+            if colors_per_vertex is not None:
+                colors_per_vertex, has_color = colors_per_vertex
+                colors[has_color] = colors_per_vertex[has_color]
+            vertices['uv3_x'] = ((colors[:, 1] << 8) | colors[:, 0]).astype(np.uint16)
+            vertices['uv3_y'] = ((colors[:, 3] << 8) | colors[:, 2]).astype(np.uint16)
+        else:
+            vertices['uv3_x'] = vertices['uv2_x']
+            vertices['uv3_y'] = vertices['uv2_y']
 
-    uvs_per_vertex = _pack_uv(uvs_per_vertex)
-    uvs_lmap_per_vertex = _pack_uv(uvs_lmap_per_vertex)
-    vertices_array = (VF * vertex_count)()
-    has_bones = hasattr(VF, 'bone_indices')
-
-    for vertex_index, vertex in enumerate(blender_mesh.vertices):
-        vertex_struct = vertices_array[vertex_index]
-
-        xyz = (vertex.co[0] * 100, vertex.co[1] * 100, vertex.co[2] * 100)
-        xyz = z_up_to_y_up(xyz)
-        if has_bones:
-            # applying bounding box constraints
-            xyz = vertices_export_locations(xyz, model_bounding_box)
-            weights_data = weights_per_vertex.get(vertex_index, [])
-            weight_values = [w for _, w in weights_data]
-            bone_indices = [bone_palette.index(bone_index) for bone_index, _ in weights_data]
-            array_size = ctypes.sizeof(vertex_struct.bone_indices)
-            vertex_struct.bone_indices = (ctypes.c_ubyte * array_size)(*bone_indices)
-            vertex_struct.weight_values = (ctypes.c_ubyte * array_size)(*weight_values)
-        vertex_struct.position_x = xyz[0]
-        vertex_struct.position_y = xyz[1]
-        vertex_struct.position_z = xyz[2]
-        vertex_struct.position_w = 32767
-
-        vertex_struct.normal_w = 255
-        vertex_struct.tangent_w = 255
-        try:
-            # TODO: use a function with a good name (range conversion + y_up_to_z_up?)
-            vertex_struct.normal_x = round(((normals[vertex_index][0] * 0.5) + 0.5) * 255)
-            vertex_struct.normal_y = round(((normals[vertex_index][2] * 0.5) + 0.5) * 255)
-            vertex_struct.normal_z = round(((normals[vertex_index][1] * -0.5) + 0.5) * 255)
-            vertex_struct.tangent_x = round(((tangents[vertex_index][0] * 0.5) + 0.5) * 255)
-            vertex_struct.tangent_y = round(((tangents[vertex_index][2] * 0.5) + 0.5) * 255)
-            vertex_struct.tangent_z = round(((tangents[vertex_index][1] * -0.5) + 0.5) * 255)
-        except KeyError:
-            # should not happen. TODO: investigate cases where it did happen
-            print('Missing normal in vertex {}, mesh {}'.format(vertex_index, mesh_index))
-        except ValueError as err:
-            # Ignore all normals/tangents if we have invalid vertices
-            # will get 0 instead
-            if "cannot convert float NaN to integer" in str(err):
-                pass
-            else:
-                raise
-        vertex_struct.uv_x = uvs_per_vertex.get(vertex_index, (0, 0))[0] if uvs_per_vertex else 0
-        vertex_struct.uv_y = uvs_per_vertex.get(vertex_index, (0, 0))[1] if uvs_per_vertex else 0
-        vertex_struct.uv2_x = uvs_lmap_per_vertex.get(vertex_index, (0, 0))[0] if uvs_lmap_per_vertex else 65535
-        vertex_struct.uv2_y = uvs_lmap_per_vertex.get(vertex_index, (0, 0))[1] if uvs_lmap_per_vertex else 65535
-        # export vertex colors
-        if max_bones_per_vertex == 0:
-            if vtx_color_flag == 1:
-                try:
-                    color = colors_per_vertex[vertex_index]
-                except:
-                    color = (255, 255, 255, 255)
-
-                _uv3_x = (color[1] << 8) | color[0]
-                _uv3_y = (color[3] << 8) | color[2]
-                vertex_struct.uv3_x = _uv3_x
-                vertex_struct.uv3_y = _uv3_y
-            else:
-                vertex_struct.uv3_x = uvs_lmap_per_vertex.get(vertex_index, (0, 0))[0] if uvs_lmap_per_vertex else 65535
-                vertex_struct.uv3_y = uvs_lmap_per_vertex.get(vertex_index, (0, 0))[1] if uvs_lmap_per_vertex else 65535
-
-    return vertices_array
+    # no copy, the ctypes array shares the memory of the numpy one
+    return (VF * vertex_count).from_buffer(vertices)
 
 
 def _check_vertex_groups(blender_mesh_object):
@@ -486,75 +535,8 @@ def _get_shadow_method(blender_material):
     return index
 
 
-def calculate_vertex_group_weight_bound(blender_mesh, armature, vertex_group):
-    vertices_in_group = []
-
-    bone_index = armature.pose.bones.find(vertex_group.name)
-    pose_bone = armature.pose.bones[bone_index]
-    pose_bone_matrix = mathutils.Matrix.Translation(pose_bone.head).inverted()
-
-    for v in blender_mesh.vertices:
-        v_groups = {g.group for g in v.groups}
-        if vertex_group.index not in v_groups:
-            continue
-        vertices_in_group.append(v)
-
-    vertices_in_group_bone_space = [pose_bone_matrix @ v.co for v in vertices_in_group]
-
-    try:
-        min_x = min((v[0] for v in vertices_in_group_bone_space))
-    except:
-        raise ExportError("The mesh {} has empty vertices group, remove them before the export".format(blender_mesh.name))
-    min_y = min((v[1] for v in vertices_in_group_bone_space))
-    min_z = min((v[2] for v in vertices_in_group_bone_space))
-    max_x = max((v[0] for v in vertices_in_group_bone_space))
-    max_y = max((v[1] for v in vertices_in_group_bone_space))
-    max_z = max((v[2] for v in vertices_in_group_bone_space))
-
-    length_x = (max_x - min_x) / 2
-    length_y = (max_y - min_y) / 2
-    length_z = (max_z - min_z) / 2
-
-    center_x = (min_x + max_x) / 2
-    center_y = (min_y + max_y) / 2
-    center_z = (min_z + max_z) / 2
-    center = (center_x, center_y, center_z)
-    # radius = max(map(lambda vertex: math.dist(center, vertex[:]), vertices_in_group_bone_space))
-    radius = max(map(lambda vertex: get_dist(center, vertex[:]), vertices_in_group_bone_space))
-    bsphere_export = (center_x * 100, center_z * 100, -center_y * 100, radius * 100)
-
-    bbox_min_export = (min_x * 100, min_z * 100, -max_y * 100, 0.0)
-    bbox_max_export = (max_x * 100, max_z * 100, -min_y * 100, 0.0)
-
-    # TODO: calculate oabb
-    # I spotted disappearing meshes (e.g. hands) in some cut-scenes (re5-> "The Wetlands")
-    # References:
-    # - https://github.com/patmo141/object_bounding_box
-    # - https://github.com/AsteriskAmpersand/Mod3-MHW-Importer/tree/master/boundingbox
-    # thanks to AsteriskAmpersand for math help
-    oabb_export = [
-        1, 0, 0, 0,
-        0, 1, 0, 0,
-        0, 0, 1, 0,
-        bsphere_export[0], bsphere_export[1], bsphere_export[2], 1
-    ]
-
-    oabb_dimension = (length_x * 100, length_z * 100, length_y * 100, 0.0)
-
-    weight_bound = WeightBound(
-            bone_id=bone_index,
-            unk_01=(ctypes.c_float * 3)(0.0, 0.0, 0.0),
-            bsphere=(ctypes.c_float * 4)(*bsphere_export),
-            bbox_min=(ctypes.c_float * 4)(*bbox_min_export),
-            bbox_max=(ctypes.c_float * 4)(*bbox_max_export),
-            oabb_matrix=(ctypes.c_float * 16)(*oabb_export),
-            oabb_dimension=(ctypes.c_float * 4)(*oabb_dimension),
-    )
-
-    return weight_bound
-
-
-def _export_meshes(blender_meshes, bone_palettes, exported_materials, model_bounding_box_export):
+def _export_meshes(blender_meshes, bone_palettes, exported_materials, model_bounding_box_export,
+                   tight_bounding_spheres=False):
     """
     No weird optimization or sharing of offsets in the vertex buffer.
     All the same offsets, different positions like pl0200.mod from
@@ -653,7 +635,7 @@ def _export_meshes(blender_meshes, bone_palettes, exported_materials, model_boun
             weight_bounds = _calculate_weight_bounds_skeletal_mesh(blender_mesh_ob, blender_mesh_ob.parent)
             weight_bounds_list.extend(weight_bounds)
         else:
-            weight_bound = _calculate_bound_static_mesh(blender_mesh_ob)
+            weight_bound = _calculate_bound_static_mesh(blender_mesh_ob, tight_bounding_spheres)
             weight_bounds_list.append(weight_bound)
 
     weight_bounds = (WeightBound * len(weight_bounds_list))(*weight_bounds_list)
@@ -662,47 +644,21 @@ def _export_meshes(blender_meshes, bone_palettes, exported_materials, model_boun
     return ExportedMeshes(meshes_156, vertex_buffer, index_buffer, weight_bounds)
 
 
-def _calculate_bound_static_mesh(blender_mesh_ob):
-
-    bl_mesh = blender_mesh_ob.data
-
-    # TODO: optimize
-    min_x = min((v.co[0] for v in bl_mesh.vertices))
-    min_y = min((v.co[1] for v in bl_mesh.vertices))
-    min_z = min((v.co[2] for v in bl_mesh.vertices))
-    max_x = max((v.co[0] for v in bl_mesh.vertices))
-    max_y = max((v.co[1] for v in bl_mesh.vertices))
-    max_z = max((v.co[2] for v in bl_mesh.vertices))
+def _calculate_bound_static_mesh(blender_mesh_ob, tight_bounding_sphere=False):
+    vertices = get_vertex_coordinates(blender_mesh_ob.data)
+    box_min, box_max = get_bounding_box(vertices)
+    min_x, min_y, min_z = box_min.tolist()
+    max_x, max_y, max_z = box_max.tolist()
 
-    length_x = (max_x - min_x) / 2
-    length_y = (max_y - min_y) / 2
-    length_z = (max_z - min_z) / 2
-
-    center_x = (min_x + max_x) / 2
-    center_y = (min_y + max_y) / 2
-    center_z = (min_z + max_z) / 2
-    center = (center_x, center_y, center_z)
-    # radius = max(map(lambda vertex: math.dist(center, vertex.co[:]), bl_mesh.vertices))
-    radius = max(map(lambda vertex: get_dist(center, vertex.co[:]), bl_mesh.vertices))
-    bsphere_export = (center_x * 100, center_z * 100, -center_y * 100, radius * 100)
+    (sphere_x, sphere_y, sphere_z), radius = get_bounding_sphere(vertices, tight=tight_bounding_sphere)
+    bsphere_export = (sphere_x * 100, sphere_z * 100, -sphere_y * 100, radius * 100)
 
     bbox_min_export = (min_x * 100, min_z * 100, -max_y * 100, 0.0)
     bbox_max_export = (max_x * 100, max_z * 100, -min_y * 100, 0.0)
 
-    # TODO: calculate oabb
-    # I spotted disappearing meshes (e.g. hands) in some cut-scenes (re5-> "The Wetlands")
-    # References:
-    # - https://github.com/patmo141/object_bounding_box
-    # - https://github.com/AsteriskAmpersand/Mod3-MHW-Importer/tree/master/boundingbox
-    # thanks to AsteriskAmpersand for math help
-    oabb_export = [
-        1, 0, 0, 0,
-        0, 1, 0, 0,
-        0, 0, 1, 0,
-        bsphere_export[0], bsphere_export[1], bsphere_export[2], 1
-    ]
-
-    oabb_dimension = (length_x * 100, length_z * 100, length_y * 100, 0.0)
+    oabbs = get_oriented_bounding_boxes(_to_export_space(vertices), np.zeros(len(vertices), dtype=np.intp), 1,
+                                         refine=True)
+    oabb_export, oabb_dimension = _get_oabb_export(*(oabb[0] for oabb in oabbs))
 
     weight_bound = WeightBound(
             bone_id=255,
@@ -717,14 +673,103 @@ def _calculate_bound_static_mesh(blender_mesh_ob):
     return weight_bound
 
 
+def _to_export_space(points):
+    """Blender coordinates to the ones in the mod (y up, x100)"""
+    return points[:, (0, 2, 1)] * (100, 100, -100)
+
+
+def _get_oabb_export(axes, center, half_extents):
+    """
+    oabb_matrix and oabb_dimension of a box from `get_oriented_bounding_boxes`.
+    The matrix has the box axes as rows and the center as the translation row.
+    The box is grown a bit so no vertex is left out after rounding it all to float32.
+    """
+    oabb_export = []
+    for axis in axes.tolist():
+        oabb_export.extend(axis + [0])
+    oabb_export.extend(center.tolist() + [1])
+    margin = (np.abs(center).max() + half_extents.max()) * 1e-6
+    oabb_dimension = tuple((half_extents + margin).tolist()) + (0.0,)
+    return oabb_export, oabb_dimension
+
+
 def _calculate_weight_bounds_skeletal_mesh(blender_mesh_ob, armature):
+    """
+    Return the WeightBounds of all the vertex groups of `blender_mesh_ob`, sorted by bone.
+    The vertices are visited once to collect the group memberships; the bounds of all
+    the groups are then reduced at once, with the vertices in the space of each bone.
+    """
+    blender_mesh = blender_mesh_ob.data
+    vertex_groups = list(blender_mesh_ob.vertex_groups)
+    bone_indices = [armature.pose.bones.find(vg.name) for vg in vertex_groups]
+    # same values as mathutils: float32 coordinates minus the float32 bone head
+    heads = np.array([armature.pose.bones[bone_index].head[:] for bone_index in bone_indices],
+                     dtype=np.float32).reshape(-1, 3)
+    co = get_vertex_coordinates(blender_mesh).astype(np.float32)
+
+    group_positions = np.full(max((vg.index for vg in vertex_groups), default=-1) + 1, -1, dtype=np.int64)
+    group_positions[[vg.index for vg in vertex_groups]] = np.arange(len(vertex_groups))
+    memberships = np.array([(vertex.index, group.group) for vertex in blender_mesh.vertices
+                            for group in vertex.groups], dtype=np.int64).reshape(-1, 2)
+    vertex_indices = memberships[:, 0]
+    groups = group_positions[memberships[:, 1]]
+    counts = np.bincount(groups, minlength=len(vertex_groups))
+    if not counts.all():
+        raise ExportError("The mesh {} has empty vertices group, remove them before the export".format(blender_mesh.name))
+
+    order = np.argsort(groups, kind='stable')
+    vertex_indices = vertex_indices[order]
+    groups = groups[order]
+    starts = np.cumsum(counts) - counts
+    points = (co[vertex_indices] - heads[groups]).astype(np.float64)
+
+    box_min = np.minimum.reduceat(points, starts)
+    box_max = np.maximum.reduceat(points, starts)
+    centers = (box_min + box_max) / 2
+    radii = _get_max_distances(points, centers, groups, starts)
+    oabbs = get_oriented_bounding_boxes(_to_export_space(points), groups, len(vertex_groups), refine=True)
+
     unsorted_weight_bounds = []
-    for vg in blender_mesh_ob.vertex_groups:
-        weight_bound = calculate_vertex_group_weight_bound(blender_mesh_ob.data, armature, vg)
+    for (min_x, min_y, min_z), (max_x, max_y, max_z), (center_x, center_y, center_z), \
+            radius, bone_index, oabb in zip(box_min.tolist(), box_max.tolist(), centers.tolist(),
+                                            radii, bone_indices, zip(*oabbs)):
+        bsphere_export = (center_x * 100, center_z * 100, -center_y * 100, radius * 100)
+
+        bbox_min_export = (min_x * 100, min_z * 100, -max_y * 100, 0.0)
+        bbox_max_export = (max_x * 100, max_z * 100, -min_y * 100, 0.0)
+
+        oabb_export, oabb_dimension = _get_oabb_export(*oabb)
+
+        weight_bound = WeightBound(
+                bone_id=bone_index,
+                unk_01=(ctypes.c_float * 3)(0.0, 0.0, 0.0),
+                bsphere=(ctypes.c_float * 4)(*bsphere_export),
+                bbox_min=(ctypes.c_float * 4)(*bbox_min_export),
+                bbox_max=(ctypes.c_float * 4)(*bbox_max_export),
+                oabb_matrix=(ctypes.c_float * 16)(*oabb_export),
+                oabb_dimension=(ctypes.c_float * 4)(*oabb_dimension),
+        )
         unsorted_weight_bounds.append(weight_bound)
+
     return sorted(unsorted_weight_bounds, key=lambda x: x.bone_id)
 
 
+def _get_max_distances(points, centers, groups, starts):
+    """
+    Largest distance from the points of each group to its center. `points` are sorted by group.
+    The candidates found with NumPy are measured again with get_dist, so the results are
+    exactly the ones of get_dist over all the points.
+    """
+    distances = get_distances(points, centers[groups])
+    max_distances = np.maximum.reduceat(distances, starts)
+    candidates = np.flatnonzero(distances >= max_distances[groups] * (1 - 1e-9))
+    radii = [0.0] * len(starts)
+    centers = centers.tolist()
+    for point_index, group in zip(candidates.tolist(), groups[candidates].tolist()):
+        radii[group] = max(radii[group], get_dist(centers[group], points[point_index].tolist()))
+    return radii
+
+
 def _export_textures_and_materials(blender_objects, saved_mod):
     '''Get array of materials and  textures for certain .mod parent
        saved_mod : <albam_reloaded.engines.mtframework.mod_156.GenMod156 object>
@@ -1,11 +1,10 @@
-from itertools import chain
 import ntpath
 import os
 
 try:
     import bpy
     import addon_utils
-    from mathutils import Matrix, Vector
+    from mathutils import Vector
     import numpy as np
 except ImportError:
     pass
@@ -14,18 +13,16 @@ from ...exceptions import BuildMeshError, TextureError
 
 from ...engines.mtframework import Arc, Mod156, Tex112, KNOWN_ARC_BLENDER_CRASH, CORRUPTED_ARCS
 from ...engines.mtframework.utils import (
-    get_vertices_array,
+    decode_vertices,
     get_indices_array,
     get_non_deform_bone_indices,
-    get_bone_parents_from_mod,
-    transform_vertices_from_bbox,
+    get_bones_world_heads,
     texture_code_to_blender_texture,
 
     )
 from ...engines.mtframework.mappers import BONE_INDEX_TO_GROUP
-from ...lib.misc import chunks
-from ...lib.half_float import unpack_half_float
-from ...lib.blender import strip_triangles_to_triangles_list
+from ...lib.blender import strip_triangles_to_triangles_array
+from ...lib.misc import map_in_pool
 from ...lib.shader_group_node import create_shader_node_group
 from ...registry import blender_registry
 
@@ -43,21 +40,31 @@ def import_arc(blender_object, file_path, **kwargs):
 
     base_dir = os.path.basename(file_path).replace('.arc', '_arc_extracted')
     out = unpack_dir or os.path.join(os.path.expanduser('~'), '.albam', 're5', base_dir)
+    # extract() returns absolute paths, which are split on it below
+    out = os.path.abspath(out)
     if not os.path.isdir(out):
         os.makedirs(out)
     if not out.endswith(os.path.sep):
         out = out + os.path.sep
 
-    arc = Arc(file_path=file_path)
     # make sure we have an empty dir (from previous imports)
     if (bpy.context.scene.albam_export_settings.clear_temp_foder_bool):
         existing_files = [os.path.join(root, f) for root, _, files in os.walk(out) for f in files]
         for f in existing_files:
             os.remove(f)
 
-    arc.unpack(out)
-    mod_files = [os.path.join(root, f) for root, _, files in os.walk(out)
-                 for f in files if f.endswith('.mod')]
+    # Only the mods and the textures they refer to are needed for importing
+    with Arc.open(file_path) as arc:
+        mod_files = arc.extract('*.mod', out)
+        for mod_file in mod_files:
+            mod = Mod156(file_path=mod_file)
+            for texture_path in mod.textures_array:
+                texture_path = texture_path[:].decode('ascii').partition('\x00')[0]
+                try:
+                    arc.extract_entry(texture_path + '.tex', out)
+                except KeyError:
+                    # Textures stored in other arcs, replaced by a placeholder when importing
+                    continue
     mod_folders = [os.path.dirname(mod_file.split(out)[-1]) for mod_file in mod_files]
 
     return {'files': mod_files,
@@ -79,11 +86,14 @@ def import_mod(blender_object, file_path, **kwargs):
     # To simplify, import only main level of detail meshes
     LODS_TO_IMPORT = (1, 255)
     blender_meshes = []
+    meshes_vertices = []  # decoded once, shared with the armature creation
     meshes = [m for m in mod.meshes_array if m.level_of_detail in LODS_TO_IMPORT]
     for i, mesh in enumerate(meshes):
         name = _create_mesh_name(i, file_path)
         try:
-            m = _build_blender_mesh_from_mod(mod, mesh, i, name, materials)
+            vertices = decode_vertices(mod, mesh)
+            meshes_vertices.append((mesh, vertices))
+            m = _build_blender_mesh_from_mod(mod, mesh, i, name, materials, vertices)
             blender_meshes.append(m)
         except BuildMeshError as err:
             # TODO: logging
@@ -94,7 +104,7 @@ def import_mod(blender_object, file_path, **kwargs):
 
     if mod.bone_count:
         armature_name = 'skel_{}'.format(blender_object.name)
-        root = _create_blender_armature_from_mod(blender_object, mod, armature_name)
+        root = _create_blender_armature_from_mod(blender_object, mod, armature_name, meshes_vertices)
         root.show_in_front = True  # set x-ray view for bones
     else:
         root = blender_object
@@ -108,11 +118,11 @@ def import_mod(blender_object, file_path, **kwargs):
             modifier.use_vertex_groups = True
 
 
-def _build_blender_mesh_from_mod(mod, mesh, mesh_index, name, materials):
+def _build_blender_mesh_from_mod(mod, mesh, mesh_index, name, materials, vertices=None):
     me_ob = bpy.data.meshes.new(name)
     ob = bpy.data.objects.new(name, me_ob)
 
-    imported_vertices = _import_vertices(mod, mesh)
+    imported_vertices = _import_vertices(mod, mesh, vertices)
     vertex_locations = imported_vertices['locations']
     vertex_normals = imported_vertices['normals']
     uvs_per_vertex = imported_vertices['uvs']
@@ -120,19 +130,27 @@ def _build_blender_mesh_from_mod(mod, mesh, mesh_index, name, materials):
     uvs_per_vertex_3 = imported_vertices['uvs3']
     vertex_colors = imported_vertices['vertex_colors']
     weights_per_bone = imported_vertices['weights_per_bone']
-    indices = get_indices_array(mod, mesh)
-    indices = strip_triangles_to_triangles_list(indices)
-    faces = chunks(indices, 3)
+    faces = strip_triangles_to_triangles_array(get_indices_array(mod, mesh))
     weights_per_bone = imported_vertices['weights_per_bone']
 
-    assert min(indices) >= 0, "Bad face indices"  # Blender crashes if not
-    me_ob.from_pydata(vertex_locations, [], faces)
+    assert not len(faces) or faces.min() >= 0, "Bad face indices"  # Blender crashes if not
+    # Sizing the mesh up front and filling it from the arrays, instead of from_pydata()
+    me_ob.vertices.add(len(vertex_locations))
+    me_ob.vertices.foreach_set('co', vertex_locations.ravel())
+    me_ob.loops.add(faces.size)
+    me_ob.loops.foreach_set('vertex_index', faces.ravel())
+    me_ob.polygons.add(len(faces))
+    me_ob.polygons.foreach_set('loop_start', np.arange(0, faces.size, 3, dtype=np.int32))
+    if bpy.app.version < (3, 6, 0):
+        # since 3.6 the sizes are derived from loop_start and loop_total can't be set
+        me_ob.polygons.foreach_set('loop_total', np.full(len(faces), 3, dtype=np.int32))
+    me_ob.update(calc_edges=True)
 
     me_ob.create_normals_split()
 
     me_ob.validate(clean_customdata=False)
     me_ob.update(calc_edges=True)
-    me_ob.polygons.foreach_set("use_smooth", [True] * len(me_ob.polygons))
+    me_ob.polygons.foreach_set("use_smooth", np.ones(len(me_ob.polygons), dtype=bool))
 
     vert_normals = np.array(vertex_normals, dtype=np.float32)
     norms = np.linalg.norm(vert_normals, axis=1, keepdims=True)
@@ -145,18 +163,22 @@ def _build_blender_mesh_from_mod(mod, mesh, mesh_index, name, materials):
         mesh_material.shadow_method = 'NONE'  # if use_cast_shadows is false and a material shadows is enabled, set it to NONE
     me_ob.materials.append(mesh_material)
 
-    for bone_index, data in weights_per_bone.items():
+    for bone_index, (vertex_indices, weights) in weights_per_bone.items():
         vg = ob.vertex_groups.new(name=str(bone_index))
-        for vertex_index, weight_value in data:
-            vg.add((vertex_index,), weight_value, 'ADD')
-
-    if uvs_per_vertex:
+        # one call per distinct weight value
+        order = np.argsort(weights, kind='stable')
+        vertex_indices = vertex_indices[order]
+        weights = weights[order]
+        starts = np.flatnonzero(np.diff(weights, prepend=-1))
+        for indices, weight in zip(np.split(vertex_indices, starts[1:]), weights[starts].tolist()):
+            vg.add(indices.tolist(), weight, 'REPLACE')
+
+    # per loop attributes are gathered from the per vertex ones
+    loop_vertex_indices = np.empty(len(me_ob.loops), dtype=np.int32)
+    me_ob.loops.foreach_get('vertex_index', loop_vertex_indices)
+    if uvs_per_vertex is not None:
         uv_layer = me_ob.uv_layers.new(name=name)
-        per_loop_list = []
-        for loop in me_ob.loops:
-            offset = loop.vertex_index * 2
-            per_loop_list.extend((uvs_per_vertex[offset], uvs_per_vertex[offset + 1]))
-        uv_layer.data.foreach_set('uv', per_loop_list)
+        uv_layer.data.foreach_set('uv', uvs_per_vertex[loop_vertex_indices].ravel())
 
     # Checking material until we find a better way. Taken from max script
     has_light_map = mod.materials_data_array[mesh.material_index].texture_indices[3] > 0
@@ -167,27 +189,13 @@ def _build_blender_mesh_from_mod(mod, mesh, mesh_index, name, materials):
         else:
             source_uvs = uvs_per_vertex_2
         uv_layer = me_ob.uv_layers.new(name="lightmap")
-        per_loop_list = []
-        for loop in me_ob.loops:
-            offset = loop.vertex_index * 2
-            per_loop_list.extend((source_uvs[offset], source_uvs[offset + 1]))
-        uv_layer.data.foreach_set('uv', per_loop_list)
+        uv_layer.data.foreach_set('uv', source_uvs[loop_vertex_indices].ravel())
 
     # vertex colors import for static meshes
     if mesh.vertex_format == 0 and mesh_material.unk_flag_8_bones_vertex:
         me_ob.vertex_colors.new(name="imported_colors")
         color_layer = me_ob.vertex_colors["imported_colors"]
-        for poly in me_ob.polygons:
-            # loop through all loops in the polygon
-            for loop_index in poly.loop_indices:
-                # print("loop index is {}".format(loop_index))
-                # get the loop object
-                loop = me_ob.loops[loop_index]
-                # check if the loop's vertex index matches the desired one
-                if vertex_colors[loop.vertex_index]:
-                    # set the color of the loop to red
-                    # color_layer.data[loop_index].color = (0.0, 1.0, 0.0, 1.0)
-                    color_layer.data[loop_index].color = vertex_colors[loop.vertex_index]
+        color_layer.data.foreach_set('color', vertex_colors[loop_vertex_indices].ravel())
 
     # Saving unknown metadata for export
     # TODO: use a util function
@@ -201,61 +209,22 @@ def _build_blender_mesh_from_mod(mod, mesh, mesh_index, name, materials):
     return ob
 
 
-def _import_vertices(mod, mesh):
-    return _import_vertices_mod156(mod, mesh)
+def _import_vertices(mod, mesh, vertices=None):
+    return _import_vertices_mod156(mod, mesh, vertices)
 
 
-def _import_vertices_mod156(mod, mesh):
-    vertices_array = get_vertices_array(mod, mesh)  # get vertices according to vertex format
-    material_array = mod.materials_data_array
+def _import_vertices_mod156(mod, mesh, vertices=None):
+    if vertices is None:
+        vertices = decode_vertices(mod, mesh)  # decode vertices according to vertex format
 
-    if mesh.vertex_format != 0:
-        locations = (transform_vertices_from_bbox(vf, mod)
-                     for vf in vertices_array)
-    else:
-        locations = ((vf.position_x, vf.position_y, vf.position_z) for vf in vertices_array)
-
-    locations = map(lambda t: (t[0] / 100, t[2] / -100, t[1] / 100), locations)
-    # from [0, 255] o [-1, 1]
-    normals = map(lambda v: (((v.normal_x / 255) * 2) - 1,
-                             ((v.normal_y / 255) * 2) - 1,
-                             ((v.normal_z / 255) * 2) - 1), vertices_array)
-    # y up to z up
-    normals = map(lambda n: (n[0], n[2] * -1, n[1]), normals)
-    uvs = [(unpack_half_float(v.uv_x), (1 - unpack_half_float(v.uv_y))) for v in vertices_array]
-    sorted_vertex_colors = []
-    # XXX: normalmap has uvs as well? and then this should be uv3?
-    if mesh.vertex_format == 0:
-        uvs2 = [(unpack_half_float(v.uv2_x), (unpack_half_float(v.uv2_y) * -1) + 1) for v in vertices_array]
-        # from [0, 255] to [0.0, 1]
-        if material_array[mesh.material_index].unk_flag_8_bones_vertex:
-            uvs3 = []
-            vertex_colors = map(lambda v: ((v.uv3_x & 0xFF) / 255,
-                                            (v.uv3_x >> 8 & 0xFF) / 255,
-                                            (v.uv3_y & 0xFF) / 255,
-                                            (v.uv3_y >> 8 & 0xFF) / 255
-                                            ), vertices_array)
-            vertex_colors = list(chain.from_iterable(vertex_colors))
-            # pack colors to a list
-            for vc in range(len(vertex_colors)//4):
-                i = vc * 4
-                b = vertex_colors[i]
-                g = vertex_colors[(i+1)]
-                r = vertex_colors[(i+2)]
-                a = vertex_colors[(i+3)]
-                sorted_vertex_colors.append((r, g, b, a))
-        else:
-            uvs3 = [(unpack_half_float(v.uv3_x), (unpack_half_float(v.uv3_y) * -1) + 1) for v in vertices_array]
-    else:
-        uvs2 = []
-        uvs3 = []
-    return {'locations': list(locations),
-            'normals': list(normals),
-            'uvs': list(chain.from_iterable(uvs)),
-            'uvs2': list(chain.from_iterable(uvs2)),
-            'uvs3': list(chain.from_iterable(uvs3)),
-            'vertex_colors': list(sorted_vertex_colors),
-            'weights_per_bone': _get_weights_per_bone(mod, mesh, vertices_array)
+    return {'locations': vertices.positions,
+            'normals': vertices.normals,
+            'uvs': vertices.uvs,
+            'uvs2': vertices.uvs2,
+            'uvs3': vertices.uvs3,
+            'vertex_colors': vertices.colors,
+            'weights_per_bone': _get_weights_per_bone(mod, mesh, vertices.bone_indices,
+                                                      vertices.weight_values)
             }
 
 
@@ -290,29 +259,30 @@ def _create_blender_textures_from_mod(mod, base_dir):
     # TODO: check why in Arc.header.file_entries[n].file_path it returns a bytes, and
     # here the whole array of chars
 
-    for i, texture_path in enumerate(mod.textures_array):
+    paths = []
+    for texture_path in mod.textures_array:
         path = texture_path[:].decode('ascii').partition('\x00')[0]  # relative path to a texture in the ARC archive without extension
         path = os.path.join(base_dir, *path.split(ntpath.sep))  # full path to a texture
         path = '.'.join((path, 'tex'))  # full path to a texture with .tex extension
-        if not os.path.isfile(path):
+        paths.append(path)
+
+    # conversions don't touch bpy, so they run up front in threads; only the data blocks are created here
+    existing_paths = [path for path in dict.fromkeys(paths) if os.path.isfile(path)]
+    converted = dict(zip(existing_paths, map_in_pool(_convert_texture, existing_paths, os.cpu_count())))
+
+    for i, path in enumerate(paths):
+        if path not in converted:
             # TODO: log warnings, figure out 'rtex' format
             print('path {} does not exist'.format(path))
             # add a placeholder instead of the missing texure
             dummy_texture = _create_dummy_texture(i, path)
             textures.append(dummy_texture)
             continue
-        tex = Tex112(path)
-        try:
-            dds = tex.to_dds()
-        except TextureError as err:
-            # TODO: log this instead of printing it
-            print('Error converting "{}"to dds: {}'.format(path, err))
+        tex, dds_path = converted[path]
+        if dds_path is None:
             dummy_texture = _create_dummy_texture(i, path)
             textures.append(dummy_texture)
             continue
-        dds_path = path.replace('.tex', '.dds')  # change extension in the full path
-        with open(dds_path, 'wb') as w:  # write bynary
-            w.write(dds)
         image = bpy.data.images.load(dds_path, check_existing=True)
         texture_name_no_extension = os.path.splitext(os.path.basename(path))[0]
         # texture_name_no_extension = str(i).zfill(2) + texture_name_no_extension
@@ -336,6 +306,24 @@ def _create_blender_textures_from_mod(mod, base_dir):
     return textures
 
 
+def _convert_texture(path):
+    """
+    Convert the .tex in `path` to a .dds next to it.
+    Return the Tex112 and the path to the .dds, None if the conversion failed.
+    """
+    tex = Tex112(path)
+    dds_path = path.replace('.tex', '.dds')  # change extension in the full path
+    try:
+        dds = tex.to_dds()
+    except TextureError as err:
+        # TODO: log this instead of printing it
+        print('Error converting "{}"to dds: {}'.format(path, err))
+        return tex, None
+    with open(dds_path, 'wb') as w:  # write bynary
+        w.write(dds)
+    return tex, dds_path
+
+
 def _create_blender_materials_from_mod(mod, model_name, textures):
     '''textures: bpy.data.textures'''
     materials = []
@@ -402,7 +390,7 @@ def _create_blender_materials_from_mod(mod, model_name, textures):
     return materials
 
 
-def _create_blender_armature_from_mod(blender_object, mod, armature_name):
+def _create_blender_armature_from_mod(blender_object, mod, armature_name, meshes_vertices=None):
     armature = bpy.data.armatures.new(armature_name)
     armature_ob = bpy.data.objects.new(armature_name, armature)
     armature_ob.parent = blender_object
@@ -419,31 +407,23 @@ def _create_blender_armature_from_mod(blender_object, mod, armature_name):
     bpy.ops.object.mode_set(mode='EDIT')
 
     blender_bones = []
-    non_deform_bone_indices = get_non_deform_bone_indices(mod)
+    non_deform_bone_indices = get_non_deform_bone_indices(mod, meshes_vertices)
+    heads = get_bones_world_heads(mod).tolist()
 
-    for i, bone in enumerate(mod.bones_array):  # add counter to the array
+    for i, head in enumerate(heads):
         blender_bone = armature.edit_bones.new(str(i))
 
         if i in non_deform_bone_indices:
             blender_bone.use_deform = False
-        parents = get_bone_parents_from_mod(bone, mod.bones_array)
-        if not parents:
-            blender_bone.head = Vector((bone.location_x / 100,
-                                        bone.location_z * -1 / 100,
-                                        bone.location_y / 100))
-            blender_bone.tail = Vector((blender_bone.head[0], blender_bone.head[1], blender_bone.head[2] + 0.01))
-        else:
-            chain = [i] + parents
-            wtm = Matrix.Translation((0, 0, 0))
-            for bi in reversed(chain):
-                b = mod.bones_array[bi]
-                wtm = wtm @ Matrix.Translation((b.location_x / 100, b.location_z / 100 * -1, b.location_y / 100))
-            blender_bone.head = wtm.to_translation()
-            blender_bone.parent = blender_bones[bone.parent_index]
-
+        blender_bone.head = Vector(head)
         blender_bone.tail = Vector((blender_bone.head[0], blender_bone.head[1], blender_bone.head[2] + 0.01))
         blender_bones.append(blender_bone)
 
+    # parents are set once all the bones exist, they aren't always stored before their children
+    for i, bone in enumerate(mod.bones_array):
+        if bone.parent_index < len(blender_bones) and bone.parent_index != i:
+            blender_bones[i].parent = blender_bones[bone.parent_index]
+
     assert len(blender_bones) == len(mod.bones_array)
 
     bpy.ops.object.mode_set(mode='OBJECT')
@@ -502,59 +482,85 @@ def _create_bone_groups(armature_ob, mod):
             },
     }
 
-    bpy.ops.object.mode_set(mode='POSE')
+    # only data properties, no operators: pose bones and bone groups are available in object mode
     for i, bone in enumerate(armature_ob.pose.bones):
         source_bone = mod.bones_array[i]
         anim_index = source_bone.anim_map_index
-        bone.bone_group = _get_or_create_bone_group(anim_index, armature_ob, i, bone_groups_cache)
-    bpy.ops.object.mode_set(mode='OBJECT')
+        bone_group_cache = _get_or_create_bone_group(anim_index, armature_ob, bone_groups_cache)
+        bone.bone_group = bone_group_cache['bl_group']
+        bone.bone.layers = bone_group_cache['layers']
 
 
-def _get_or_create_bone_group(bone_anim_index, armature_ob, bone_index, bone_groups_cache):
+def _get_or_create_bone_group(bone_anim_index, armature_ob, bone_groups_cache):
     bone_group_name = BONE_INDEX_TO_GROUP.get(bone_anim_index, 'OTHER')
 
     bone_group_cache = bone_groups_cache.get(bone_group_name) or bone_groups_cache['OTHER']
-    layer_index = bone_group_cache['layer']
-    _move_bone_to_layers(armature_ob, bone_index, 0, layer_index)
-
     if bone_group_cache.get('bl_group'):
-        return bone_group_cache['bl_group']
+        return bone_group_cache
 
     bl_bone_group = armature_ob.pose.bone_groups.new(name=bone_group_cache['name'])
     bl_bone_group.color_set = bone_group_cache['color_set']
     bone_group_cache['bl_group'] = bl_bone_group
+    bone_group_cache['layers'] = _get_layers(0, bone_group_cache['layer'])
 
-    return bl_bone_group
+    return bone_group_cache
 
 
-def _move_bone_to_layers(armature_ob, bone_index, *layer_indices):
+def _get_layers(*layer_indices):
     layers = [False] * 32
     for layer_index in layer_indices:
         layers[layer_index] = True
-    armature_ob.data.bones[bone_index].select = True
-    bpy.ops.pose.bone_layers(layers=layers)
-    armature_ob.data.bones[bone_index].select = False
+    return layers
 
 
-def _get_weights_per_bone(mod, mesh, vertices_array):
+def _get_weights_per_bone(mod, mesh, bone_indices, weight_values):
+    """
+    Return {real bone index: (vertex indices, weights)}, in order of first appearance,
+    with float32 weights of the same vertex and bone added up and clamped to 1,
+    as adding them one by one to a vertex group would do.
+    """
     weights_per_bone = {}
-    if not mod.bone_count or not hasattr(vertices_array[0], 'bone_indices'):
+    if not mod.bone_count or bone_indices is None:
         return weights_per_bone
     bone_palette = mod.bone_palette_array[mesh.bone_palette_index]
-    for vertex_index, vertex in enumerate(vertices_array):
-        for bi, bone_index in enumerate(vertex.bone_indices):
+    # lookup table from the bone indices of the vertices to real bone indices
+    real_bone_indices = np.full(256, -1, dtype=np.int64)
+    for bone_index in range(256):
+        try:
             if bone_index >= bone_palette.unk_01:
-                real_bone_index = mod.bones_animation_mapping[bone_index]
+                real_bone_indices[bone_index] = mod.bones_animation_mapping[bone_index]
             else:
                 try:
-                    real_bone_index = bone_palette.values[bone_index]
+                    real_bone_indices[bone_index] = bone_palette.values[bone_index]
                 except IndexError:
                     # Behaviour not observed in original files so far
-                    real_bone_index = bone_index
-            if bone_index + vertex.weight_values[bi] == 0:
-                continue
-            bone_data = weights_per_bone.setdefault(real_bone_index, [])
-            bone_data.append((vertex_index, vertex.weight_values[bi] / 255))
+                    real_bone_indices[bone_index] = bone_index
+        except IndexError:
+            continue
+
+    vertex_count, bones_per_vertex = bone_indices.shape
+    used = (bone_indices != 0) | (weight_values != 0)
+    if not used.any():
+        return weights_per_bone
+    vertex_indices = np.repeat(np.arange(vertex_count), bones_per_vertex).reshape(used.shape)[used]
+    real = real_bone_indices[bone_indices[used]]
+    if (real < 0).any():
+        raise IndexError('Bone index out of the bones animation mapping')
+    weights = (weight_values[used] / 255).astype(np.float32)
+
+    keys, first, inverse = np.unique(real * vertex_count + vertex_indices,
+                                     return_index=True, return_inverse=True)
+    summed = np.zeros(len(keys), dtype=np.float32)
+    np.add.at(summed, inverse.ravel(), weights)
+    np.minimum(summed, 1, out=summed)
+
+    # keys are sorted, so the vertices of each bone are contiguous
+    key_bones = keys // vertex_count
+    bones, bone_first = np.unique(real, return_index=True)
+    starts = np.searchsorted(key_bones, bones)
+    ends = np.searchsorted(key_bones, bones, side='right')
+    for i in np.argsort(bone_first).tolist():
+        weights_per_bone[int(bones[i])] = (keys[starts[i]:ends[i]] % vertex_count, summed[starts[i]:ends[i]])
     return weights_per_bone
 
 
@@ -1,8 +1,8 @@
 from ctypes import c_int, c_uint, c_char, c_short, c_float, c_ubyte, sizeof
-import os
 
-from ...exceptions import ExportError
+from ...exceptions import ExportError, TextureError
 from ...image_formats.dds import DDSHeader, DDS
+from ...image_formats.decoders import decode_image
 from ...lib.structure import DynamicStructure
 from ...registry import blender_registry
 from ...engines.mtframework.defaults import DEFAULT_TEXTURE
@@ -40,7 +40,7 @@ class Tex112(DynamicStructure):
                 ('unk_f_alpha', c_float),
                 ("floats_unk", lambda s: c_float * 27 if s.image_count > 1 else c_ubyte * 0),
                 ('mipmap_offsets', lambda s: c_uint * (s.mipmap_count * s.image_count)),
-                ('dds_data', lambda s, f: c_ubyte * (os.path.getsize(f) - 40 -
+                ('dds_data', lambda s, f: c_ubyte * (len(f) - 40 -
                  sizeof(s.mipmap_offsets)) if f else c_ubyte * len(s.dds_data)),
                 )
 
@@ -60,6 +60,16 @@ class Tex112(DynamicStructure):
         dds = DDS(header=header, data=self.dds_data)
         return dds
 
+    def decode(self, mipmap_level=0):
+        """Decode a mipmap level (of the first image) into an (height, width, 4) uint8 rgba array"""
+        if mipmap_level >= self.mipmap_count:
+            raise TextureError('Mipmap level {} out of range ({} levels)'.format(mipmap_level, self.mipmap_count))
+        fmt = b'' if self.compression_format == UNCOMPRESSED_TAG else self.compression_format
+        offset = self.mipmap_offsets[mipmap_level] - self.mipmap_offsets[0]
+        width = max(1, self.width >> mipmap_level)
+        height = max(1, self.height >> mipmap_level)
+        return decode_image(memoryview(self.dds_data)[offset:], width, height, fmt)
+
     @classmethod
     def from_dds(cls, file_path):
         with open(file_path, 'rb') as f:
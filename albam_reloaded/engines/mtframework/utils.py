@@ -2,9 +2,14 @@ try:
     import bpy
 except ImportError:
     pass
+try:
+    import numpy as np
+except ImportError:
+    pass
 
 import ctypes
-from collections import Counter
+from collections import Counter, namedtuple
+from functools import lru_cache
 import ntpath
 
 from albam_reloaded.engines.mtframework import tex
@@ -13,10 +18,101 @@ from ...exceptions import BuildMeshError
 from ...engines.mtframework.mod_156 import (
     VERTEX_FORMATS_TO_CLASSES,
     )
+from ...lib.half_float import unpack_half_floats
 from ...lib.structure import get_size
 
 
-def get_vertices_array(mod, mesh):
+CTYPES_TO_DTYPES = {
+    ctypes.c_float: '<f4',
+    ctypes.c_short: '<i2',
+    ctypes.c_ushort: '<u2',
+    ctypes.c_ubyte: 'u1',
+}
+
+DecodedVertices = namedtuple('DecodedVertices', ('positions', 'normals', 'uvs', 'uvs2', 'uvs3',
+                                                 'colors', 'bone_indices', 'weight_values'))
+
+
+@lru_cache(maxsize=None)
+def get_vertex_dtype(vertex_format_class):
+    """NumPy structured dtype with the same layout as a VertexFormat class"""
+    fields = []
+    for attr_name, c_type in vertex_format_class._fields_:
+        if issubclass(c_type, ctypes.Array):
+            fields.append((attr_name, CTYPES_TO_DTYPES[c_type._type_], (c_type._length_,)))
+        else:
+            fields.append((attr_name, CTYPES_TO_DTYPES[c_type]))
+    dtype = np.dtype(fields)
+    assert dtype.itemsize == ctypes.sizeof(vertex_format_class)
+    return dtype
+
+
+def get_vertices_records(mod, mesh):
+    """Vertices of `mesh` as a NumPy record array over the vertex buffer of `mod` (no copy)"""
+    VF, offset, vertex_count = _get_vertices_location(mod, mesh)
+    return np.frombuffer(mod.vertex_buffer, dtype=get_vertex_dtype(VF), count=vertex_count, offset=offset)
+
+
+def decode_vertices(mod, mesh):
+    """
+    Decode the vertices of `mesh` in one go, returning a `DecodedVertices` of float32 arrays
+    ready for Blender (z up): positions (N, 3), normals (N, 3) in [-1, 1], uvs (N, 2)
+    flipped for dds textures, and colors (N, 4) as rgba in [0, 1].
+    uvs2, uvs3 and colors are None if the vertex format doesn't have them; bone_indices
+    and weight_values (N, bones per vertex) are the raw uint8 values, or None.
+    """
+    vertices = get_vertices_records(mod, mesh)
+    names = vertices.dtype.names
+
+    positions = np.empty((len(vertices), 3), dtype=np.float64)
+    for i, axis in enumerate('xyz'):
+        positions[:, i] = vertices['position_' + axis]
+    if mesh.vertex_format != 0:
+        box_min = np.array((mod.box_min_x, mod.box_min_y, mod.box_min_z))
+        box_max = np.array((mod.box_max_x, mod.box_max_y, mod.box_max_z))
+        positions = positions / 32767 * (box_max - box_min) + box_min
+    # y up to z up
+    positions = (positions[:, (0, 2, 1)] / (100, -100, 100)).astype(np.float32)
+
+    normals = np.empty((len(vertices), 3), dtype=np.float64)
+    for i, axis in enumerate('xzy'):
+        # from [0, 255] to [-1, 1]
+        normals[:, i] = vertices['normal_' + axis] / 255 * 2 - 1
+    normals[:, 1] *= -1
+    normals = normals.astype(np.float32)
+
+    uvs = _decode_uvs(vertices, 'uv_x', 'uv_y')
+    uvs2 = uvs3 = colors = None
+    # XXX: normalmap has uvs as well? and then this should be uv3?
+    if mesh.vertex_format == 0:
+        uvs2 = _decode_uvs(vertices, 'uv2_x', 'uv2_y')
+        if mod.materials_data_array[mesh.material_index].unk_flag_8_bones_vertex:
+            # bgra bytes, from [0, 255] to [0.0, 1]
+            colors = np.empty((len(vertices), 2), dtype='<u2')
+            colors[:, 0] = vertices['uv3_x']
+            colors[:, 1] = vertices['uv3_y']
+            colors = (colors.view(np.uint8)[:, (2, 1, 0, 3)] / 255).astype(np.float32)
+        else:
+            uvs3 = _decode_uvs(vertices, 'uv3_x', 'uv3_y')
+
+    if 'bone_indices' in names:
+        bone_indices = vertices['bone_indices']
+        weight_values = vertices['weight_values']
+    else:
+        bone_indices = weight_values = None
+
+    return DecodedVertices(positions, normals, uvs, uvs2, uvs3, colors, bone_indices, weight_values)
+
+
+def _decode_uvs(vertices, x_name, y_name):
+    uvs = np.empty((len(vertices), 2), dtype=np.float64)
+    uvs[:, 0] = unpack_half_floats(vertices[x_name])
+    uvs[:, 1] = 1 - unpack_half_floats(vertices[y_name]).astype(np.float64)
+    return uvs.astype(np.float32)
+
+
+def _get_vertices_location(mod, mesh):
+    """Return the VertexFormat class, the offset in mod.vertex_buffer and the count of the vertices of `mesh`"""
     try:
         VF = VERTEX_FORMATS_TO_CLASSES[mesh.vertex_format]
     except KeyError:
@@ -36,10 +132,7 @@ def get_vertices_array(mod, mesh):
         vertex_count = mesh.vertex_count
     else:
         raise TypeError('Unsupported mod version: {}'.format(mod.version))
-    offset = ctypes.addressof(mod.vertex_buffer)
-    offset += mesh.vertex_offset
-    offset += position
-    return (VF * vertex_count).from_address(offset)
+    return VF, mesh.vertex_offset + position, vertex_count
 
 
 def get_indices_array(mod, mesh):
@@ -54,66 +147,76 @@ def get_indices_array(mod, mesh):
     return (ctypes.c_ushort * mesh.face_count).from_address(offset)
 
 
-def get_non_deform_bone_indices(mod):
-    bone_indices = {i for i, _ in enumerate(mod.bones_array)}
-
-    active_bone_indices = set()
-
-    for mesh_index, mesh in enumerate(mod.meshes_array):
-        for vi, vert in enumerate(get_vertices_array(mod, mesh)):
-            for bone_index in getattr(vert, "bone_indices", []):
-                try:
-                    real_bone_index = mod.bone_palette_array[mesh.bone_palette_index].values[bone_index]
-                except IndexError:
-                    # Behavior not observed on original files
-                    real_bonde_index = bone_index
-                active_bone_indices.add(real_bone_index)
-
-    return bone_indices.difference(active_bone_indices)
-
-
-def vertices_export_locations(xyz_tuple, model_bounding_box):
-    x, y, z = xyz_tuple
-
-    x -= model_bounding_box.min_x
-    x /= (model_bounding_box.max_x -  model_bounding_box.min_x)
-    x *= 32767
-
-    y -= model_bounding_box.min_y
-    y /= (model_bounding_box.max_y - model_bounding_box.min_y)
-    y *= 32767
-
-    z -= model_bounding_box.min_z
-    z /= (model_bounding_box.max_z - model_bounding_box.min_z)
-    z *= 32767
-
-    return (round(x), round(y), round(z))
-
-
-def transform_vertices_from_bbox(vertex_format, mod):
-    x = vertex_format.position_x
-    y = vertex_format.position_y
-    z = vertex_format.position_z
-
-    x  = x / 32767 * (mod.box_max_x - mod.box_min_x) + mod.box_min_x
-    y  = y / 32767 * (mod.box_max_y - mod.box_min_y) + mod.box_min_y
-    z  = z / 32767 * (mod.box_max_z - mod.box_min_z) + mod.box_min_z
-
-    return (x, y, z)
-
-
-def get_bone_parents_from_mod(bone, bones_array):
-    parents = []
-    parent_index = bone.parent_index
-    child_bone = bone
-    if parent_index != 255:
-        parents.append(parent_index)
-    while parent_index != 255:
-        child_bone = bones_array[child_bone.parent_index]
-        parent_index = child_bone.parent_index
-        if parent_index != 255:
-            parents.append(parent_index)
-    return parents
+def get_non_deform_bone_indices(mod, meshes_vertices=None):
+    """
+    Return the indices of the bones not referenced by any vertex.
+    `meshes_vertices` is a sequence of (mesh, DecodedVertices), e.g. the meshes already
+    decoded for importing; by default all the meshes of `mod` are looked at.
+    """
+    if meshes_vertices is None:
+        meshes_bone_indices = ((mesh, get_vertices_records(mod, mesh)) for mesh in mod.meshes_array)
+        meshes_bone_indices = ((mesh, vertices['bone_indices'] if 'bone_indices' in vertices.dtype.names else None)
+                               for mesh, vertices in meshes_bone_indices)
+    else:
+        meshes_bone_indices = ((mesh, vertices.bone_indices) for mesh, vertices in meshes_vertices)
+
+    active_bone_indices = np.zeros(mod.bone_count, dtype=bool)
+    for mesh, bone_indices in meshes_bone_indices:
+        if bone_indices is None:
+            continue
+        used_bone_indices = np.unique(bone_indices)
+        # lookup table bone index -> real bone index. Out of the palette: behavior not observed on original files
+        real_bone_indices = np.arange(256)
+        if mesh.bone_palette_index < len(mod.bone_palette_array):
+            palette_values = mod.bone_palette_array[mesh.bone_palette_index].values
+            real_bone_indices[:len(palette_values)] = palette_values
+        real = real_bone_indices[used_bone_indices]
+        active_bone_indices[real[real < mod.bone_count]] = True
+
+    return set(np.flatnonzero(~active_bone_indices).tolist())
+
+
+def get_bones_world_heads(mod):
+    """
+    Return a (bone_count, 3) float32 array with the head of every bone in
+    blender space, accumulating the locations (relative to the parent) from
+    the roots down, one level of the hierarchy at a time.
+    Bones whose chain doesn't reach a root (missing parent or loops) take the
+    translation of their world transform matrix instead.
+    """
+    bone_count = len(mod.bones_array)
+    parents = np.array([bone.parent_index for bone in mod.bones_array], dtype=np.intp)
+    locations = np.array([(bone.location_x / 100, bone.location_z * -1 / 100, bone.location_y / 100)
+                          for bone in mod.bones_array], dtype=np.float32).reshape(-1, 3)
+
+    children = [[] for _ in range(bone_count)]
+    for bone_index, parent_index in enumerate(parents.tolist()):
+        if parent_index < bone_count and parent_index != bone_index:
+            children[parent_index].append(bone_index)
+
+    heads = np.zeros((bone_count, 3), dtype=np.float32)
+    resolved = np.zeros(bone_count, dtype=bool)
+    level = np.flatnonzero(parents == 255)
+    heads[level] = locations[level]
+    while level.size:
+        resolved[level] = True
+        level = np.array([c for bone_index in level.tolist() for c in children[bone_index]], dtype=np.intp)
+        heads[level] = heads[parents[level]] + locations[level]
+
+    unresolved = np.flatnonzero(~resolved)
+    if unresolved.size:
+        world_matrices = np.ctypeslib.as_array(mod.bones_world_transform_matrix_array).reshape(-1, 4, 4)
+        for bone_index in unresolved.tolist():
+            heads[bone_index] = locations[bone_index]
+            if bone_index >= len(world_matrices):
+                continue
+            try:
+                # the matrices are the inverse of the bind pose
+                x, y, z = np.linalg.inv(world_matrices[bone_index].astype(np.float64))[3, :3]
+            except np.linalg.LinAlgError:
+                continue
+            heads[bone_index] = (x / 100, z * -1 / 100, y / 100)
+    return heads
 
 
 def texture_code_to_blender_texture(texture_code, blender_texture_node, blender_material):
@@ -1,7 +1,7 @@
 from ctypes import Structure, sizeof, c_int, c_char, c_ubyte
-import os
 
 from ..exceptions import TextureError
+from .decoders import decode_image
 from ..lib.structure import DynamicStructure
 
 
@@ -174,5 +174,17 @@ class DDSHeader(Structure):
 class DDS(DynamicStructure):
     _fields_ = (
         ('header', DDSHeader),
-        ('data', lambda s, f: c_ubyte * (os.path.getsize(f) - sizeof(s.header)) if f else c_ubyte * len(s.data)),
+        ('data', lambda s, f: c_ubyte * (len(f) - sizeof(s.header)) if f else c_ubyte * len(s.data)),
     )
+
+    def decode(self, mipmap_level=0):
+        """Decode a mipmap level (of the first image) into an (height, width, 4) uint8 rgba array"""
+        header = self.header
+        if mipmap_level and mipmap_level >= header.dwMipMapCount:
+            raise TextureError('Mipmap level {} out of range ({} levels)'.format(mipmap_level, header.dwMipMapCount))
+        fmt = header.pixelfmt_dwFourCC
+        offset = sum(header.calculate_mipmap_size(header.dwWidth, header.dwHeight, i, fmt)
+                     for i in range(mipmap_level))
+        width = max(1, header.dwWidth >> mipmap_level)
+        height = max(1, header.dwHeight >> mipmap_level)
+        return decode_image(memoryview(self.data)[offset:], width, height, fmt)
@@ -0,0 +1,136 @@
+try:
+    import numpy as np
+except ImportError:
+    pass
+
+from ..exceptions import TextureError
+
+
+def decode_image(data, width, height, fmt):
+    """
+    Decode one image (e.g. a mipmap level) from `data`, any object supporting the
+    buffer protocol, into an (height, width, 4) uint8 rgba array.
+    `fmt` is the dds FourCC (b'DXT1', b'DXT5') or an empty value for uncompressed
+    bgra pixels, like the RE5 .tex use.
+    """
+    if not fmt:
+        return decode_bgra8(data, width, height)
+    try:
+        decoder = DECODERS[fmt]
+    except KeyError:
+        raise TextureError("Can't decode format {}".format(fmt))
+    return decoder(data, width, height)
+
+
+def decode_bgra8(data, width, height):
+    pixels = _get_bytes(data, width * height * 4, width, height)
+    return pixels.reshape(height, width, 4)[:, :, (2, 1, 0, 3)]
+
+
+def decode_bc1(data, width, height):
+    """DXT1: 8 bytes per 4x4 block, with the 1 bit alpha mode"""
+    blocks = _get_blocks(data, width, height, 8)
+    pixels = _decode_color_blocks(blocks, allow_alpha=True)
+    return _blocks_to_image(pixels, width, height)
+
+
+def decode_bc3(data, width, height):
+    """DXT5: 16 bytes per 4x4 block, an interpolated alpha block followed by a DXT1 color block"""
+    blocks = _get_blocks(data, width, height, 16)
+    pixels = _decode_color_blocks(blocks[..., 8:], allow_alpha=False)
+    pixels[..., 3] = _decode_alpha_blocks(blocks[..., :8])
+    return _blocks_to_image(pixels, width, height)
+
+
+DECODERS = {
+    b'DXT1': decode_bc1,
+    b'BC1': decode_bc1,
+    b'DXT5': decode_bc3,
+    b'BC3': decode_bc3,
+}
+
+
+def _get_blocks(data, width, height, block_size):
+    """(blocks_high, blocks_wide, block_size) uint8 view over `data`"""
+    blocks_wide = max(1, (width + 3) // 4)
+    blocks_high = max(1, (height + 3) // 4)
+    blocks = _get_bytes(data, blocks_wide * blocks_high * block_size, width, height)
+    return blocks.reshape(blocks_high, blocks_wide, block_size)
+
+
+def _get_bytes(data, count, width, height):
+    data = np.frombuffer(data, dtype=np.uint8)
+    if len(data) < count:
+        raise TextureError('Not enough data for a {}x{} image'.format(width, height))
+    return data[:count]
+
+
+def _decode_color_blocks(blocks, allow_alpha):
+    """
+    Decode the 8 bytes color blocks of `blocks` (..., 8) into (..., 16, 4) rgba pixels.
+    With `allow_alpha` (DXT1), blocks with color_0 <= color_1 use 3 colors plus transparent black.
+    """
+    colors_565 = np.ascontiguousarray(blocks[..., :4]).view('<u2').astype(np.uint16)
+    r = (colors_565 >> 11) & 0x1F
+    g = (colors_565 >> 5) & 0x3F
+    b = colors_565 & 0x1F
+    endpoints = np.stack(((r << 3) | (r >> 2), (g << 2) | (g >> 4), (b << 3) | (b >> 2)), axis=-1)
+    c0 = endpoints[..., 0, :]
+    c1 = endpoints[..., 1, :]
+
+    palette = np.empty(blocks.shape[:-1] + (4, 4), dtype=np.uint8)
+    palette[..., 3] = 255
+    palette[..., 0, :3] = c0
+    palette[..., 1, :3] = c1
+    palette[..., 2, :3] = (2 * c0 + c1) // 3
+    palette[..., 3, :3] = (c0 + 2 * c1) // 3
+    if allow_alpha:
+        three_colors = colors_565[..., 0] <= colors_565[..., 1]
+        palette[three_colors, 2, :3] = (c0[three_colors] + c1[three_colors]) // 2
+        palette[three_colors, 3] = 0
+
+    # 2 bits per pixel, a byte per row
+    indices = blocks[..., 4:8, None] >> np.arange(0, 8, 2, dtype=np.uint8) & 3
+    indices = indices.reshape(blocks.shape[:-1] + (16,))
+    # look up whole rgba pixels at once, as uint32
+    pixels = _lookup(palette.view('<u4')[..., 0], indices)
+    return pixels.view(np.uint8).reshape(pixels.shape + (4,))
+
+
+def _decode_alpha_blocks(blocks):
+    """Decode the 8 bytes alpha blocks of `blocks` (..., 8) into (..., 16) alpha values"""
+    a0 = blocks[..., 0].astype(np.uint16)
+    a1 = blocks[..., 1].astype(np.uint16)
+
+    # a0 > a1: 6 interpolated values, else 4 interpolated values plus 0 and 255
+    weights = np.arange(1, 7, dtype=np.uint16)
+    interpolated = np.where((a0 > a1)[..., None],
+                            ((7 - weights) * a0[..., None] + weights * a1[..., None]) // 7,
+                            ((5 - weights % 5) * a0[..., None] + weights % 5 * a1[..., None]) // 5)
+    interpolated[a0 <= a1, 4:] = (0, 255)
+    palette = np.empty(blocks.shape[:-1] + (8,), dtype=np.uint8)
+    palette[..., 0] = a0
+    palette[..., 1] = a1
+    palette[..., 2:] = interpolated
+
+    # 3 bits per pixel, 8 pixels in each 3 bytes (little endian)
+    bits = blocks[..., 2:8].astype(np.uint32).reshape(blocks.shape[:-1] + (2, 3))
+    bits = bits[..., 0] | bits[..., 1] << 8 | bits[..., 2] << 16
+    indices = bits[..., None] >> np.arange(0, 24, 3, dtype=np.uint32) & 7
+    return _lookup(palette, indices.reshape(blocks.shape[:-1] + (16,)))
+
+
+def _lookup(palette, indices):
+    """Values of `palette` (..., P) at `indices` (..., N), for every block at once"""
+    palette_size = palette.shape[-1]
+    flat_palette = palette.reshape(-1)
+    offsets = np.arange(0, flat_palette.size, palette_size).reshape(palette.shape[:-1] + (1,))
+    return flat_palette[indices + offsets]
+
+
+def _blocks_to_image(rgba, width, height):
+    """(blocks_high, blocks_wide, 16, 4) pixels to a (height, width, 4) image"""
+    blocks_high, blocks_wide = rgba.shape[:2]
+    image = rgba.reshape(blocks_high, blocks_wide, 4, 4, 4).transpose(0, 2, 1, 3, 4)
+    image = image.reshape(blocks_high * 4, blocks_wide * 4, 4)
+    return np.ascontiguousarray(image[:height, :width])
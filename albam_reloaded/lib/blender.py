@@ -2,9 +2,15 @@ try:
     import bpy
 except ImportError:
     pass
-from collections import deque, namedtuple
+try:
+    import numpy as np
+except ImportError:
+    pass
+from collections import namedtuple
 import math
 
+from .bounds import get_bounding_box, get_bounding_sphere
+
 
 BoundingBox = namedtuple('bounding_box', (
     'min_x', 'min_y', 'min_z',
@@ -12,36 +18,27 @@ BoundingBox = namedtuple('bounding_box', (
 ))
 
 
-def get_model_bounding_box(blender_objects):
-    meshes = (ob.data for ob in blender_objects if ob.type == 'MESH')
-    min_x = 99999999
-    min_y = 99999999
-    min_z = 99999999
-
-    max_x = -99999999
-    max_y = -99999999
-    max_z = -99999999
-
-
-    for mesh in meshes:
-        for vert in mesh.vertices:
-            x, y, z = vert.co[:]
-            if x > max_x:
-                max_x = x
-            if y > max_y:
-                max_y = y
-            if z > max_z:
-                max_z = z
-            if x < min_x:
-                min_x = x
-            if y < min_y:
-                min_y = y
-            if z < min_z:
-                min_z = z
-    return BoundingBox(
-            min_x, min_y, min_z,
-            max_x, max_y, max_z
-    )
+def get_vertex_coordinates(blender_mesh):
+    """(vertex_count, 3) float64 array with the coordinates of the vertices of `blender_mesh`"""
+    co = np.empty(len(blender_mesh.vertices) * 3, dtype=np.float32)
+    blender_mesh.vertices.foreach_get('co', co)
+    return co.reshape(-1, 3).astype(np.float64)
+
+
+def get_model_vertex_coordinates(blender_objects):
+    meshes = [ob.data for ob in blender_objects if ob.type == 'MESH']
+    if not meshes:
+        return np.empty((0, 3), dtype=np.float64)
+    return np.concatenate([get_vertex_coordinates(mesh) for mesh in meshes])
+
+
+def get_model_bounding_box(blender_objects, vertex_coordinates=None):
+    if vertex_coordinates is None:
+        vertex_coordinates = get_model_vertex_coordinates(blender_objects)
+    if not len(vertex_coordinates):
+        return BoundingBox(99999999, 99999999, 99999999, -99999999, -99999999, -99999999)
+    box_min, box_max = get_bounding_box(vertex_coordinates)
+    return BoundingBox(*box_min.tolist(), *box_max.tolist())
 
 
 def get_dist(point_a, point_b):
@@ -54,123 +51,155 @@ def get_dist(point_a, point_b):
     return magnitude
 
 
-def get_model_bounding_sphere(blender_objects):
-    # TODO: optimize
-
-    bbox = get_model_bounding_box(blender_objects)
-    meshes = (ob.data for ob in blender_objects if ob.type == 'MESH')
-    vertices = (v.co for mesh in meshes for v in mesh.vertices)
-
-    center_x = (bbox.min_x + bbox.max_x) / 2
-    center_y = (bbox.min_y + bbox.max_y) / 2
-    center_z = (bbox.min_z + bbox.max_z) / 2
-    center = [center_x, center_y, center_z]
-
-    #radius = max(map(lambda vertex: math.dist(center, vertex), vertices))
-    radius = max(map(lambda vertex: get_dist(center, vertex), vertices))
-    return center + [radius]
+def get_model_bounding_sphere(blender_objects, vertex_coordinates=None, tight=False):
+    """Return [center_x, center_y, center_z, radius]"""
+    if vertex_coordinates is None:
+        vertex_coordinates = get_model_vertex_coordinates(blender_objects)
+    center, radius = get_bounding_sphere(vertex_coordinates, tight=tight)
+    return center.tolist() + [float(radius)]
 
 
 def strip_triangles_to_triangles_list(strip_indices_array):
-    indices = []
-    offset = min(strip_indices_array)
-
-    for i in range(2, len(strip_indices_array)):
-        a = strip_indices_array[i - 2]
-        b = strip_indices_array[i - 1]
-        c = strip_indices_array[i]
-        if a != b and a != c and b != c:
-            if i % 2 == 0:
-                indices.extend((a - offset, b - offset, c - offset))
-            else:
-                indices.extend((c - offset, b - offset, a - offset))
-    if not indices:
+    triangles = strip_triangles_to_triangles_array(strip_indices_array)
+    if not len(triangles):
         return list(strip_indices_array)
-    return indices
+    return triangles.ravel().tolist()
+
+
+def strip_triangles_to_triangles_array(strip_indices_array):
+    """
+    Convert a triangle strip to an (N, 3) int32 array of triangles, ready for foreach_set.
+    Degenerate triangles are dropped, odd triangles are flipped to keep their winding,
+    and indices are made relative to the lowest one.
+    `strip_indices_array` can be a ctypes array (e.g. from get_indices_array), which is
+    read through the buffer protocol without copying.
+    """
+    strip = np.asarray(strip_indices_array)
+    offset = strip.min()
+    strip = strip.astype(np.int32) - offset
+    triangles = np.stack((strip[:-2], strip[1:-1], strip[2:]), axis=1)
+    triangles[1::2] = triangles[1::2, ::-1]
+    a, b, c = triangles.T
+    return triangles[(a != b) & (a != c) & (b != c)]
 
 
 def triangles_list_to_triangles_strip(blender_mesh):
     """
     Export triangle strips from a blender mesh.
     It assumes the mesh is all triangulated.
+    """
+    loop_starts = np.empty(len(blender_mesh.polygons), dtype=np.int32)
+    blender_mesh.polygons.foreach_get('loop_start', loop_starts)
+    loop_vertex_indices = np.empty(len(blender_mesh.loops), dtype=np.int32)
+    blender_mesh.loops.foreach_get('vertex_index', loop_vertex_indices)
+    triangles = loop_vertex_indices[loop_starts[:, np.newaxis] + np.arange(3)]
+    return triangles_to_triangles_strip(triangles).tolist()
+
+
+def triangles_to_triangles_strip(triangles, allow_jumps=True):
+    """
+    Build a triangle strip from an (N, 3) array of vertex indices, keeping the winding
+    of each triangle as `strip_triangles_to_triangles_list` reads it back:
+    triangle i is (s[i], s[i + 1], s[i + 2]) if i is even, reversed if i is odd.
+    Strips are joined with degenerate triangles into a single int32 array.
+
+    Runs in linear time: faces are looked up by directed edge and by vertex, and
+    marked in a visited bitmap. A strip goes on through its last edge while the face
+    on the other side is free. If not and `allow_jumps` is set, it jumps to a free face
+    around its last vertex with 2 degenerate triangles; otherwise a new strip is started
+    instead, giving more and shorter strips. Joining strips takes 2 or 3 degenerate
+    triangles.
     Based on a paper by Pierre Terdiman: http://www.codercorner.com/Strips.htm
     """
-    # TODO: Fix changing of face orientation in some cases (see tests)
-    edges_faces = {}
-    current_strip = []
+    triangles = np.asarray(triangles, dtype=np.int64).reshape(-1, 3)
+    face_count = len(triangles)
+    if not face_count:
+        return np.empty(0, dtype=np.int32)
+    a, b, c = triangles.T
+    n = int(triangles.max()) + 1
+    faces = np.arange(face_count)
+
+    # {directed edge: face}, edges as a * n + b
+    edges_faces = dict(zip(np.concatenate((a * n + b, b * n + c, c * n + a)).tolist(),
+                           np.tile(faces, 3).tolist()))
+    # faces around each vertex v, as vertex_faces[cursors[v]:ends[v]]. Cursors skip visited faces
+    order = np.argsort(triangles.ravel(), kind='stable')
+    vertex_faces = (order // 3).tolist()
+    ends = np.cumsum(np.bincount(triangles.ravel(), minlength=n))
+    cursors = (ends - np.bincount(triangles.ravel(), minlength=n)).tolist()
+    ends = ends.tolist()
+
+    tris = triangles.tolist()
+    # degenerate triangles can't be represented in a strip
+    visited = bytearray(((a == b) | (b == c) | (a == c)).astype(np.uint8).tobytes())
     strips = []
-    joined_strips = []
-    faces_indices = deque(p.index for p in blender_mesh.polygons)
-    done_faces_indices = set()
-    current_face_index = faces_indices.popleft()
-    process_faces = True
-
-    for polygon in blender_mesh.polygons:
-        for edge in polygon.edge_keys:
-            edges_faces.setdefault(edge, set()).add(polygon.index)
-
-    while process_faces:
-        current_face = blender_mesh.polygons[current_face_index]
-        current_face_verts = current_face.vertices[:]
-        strip_indices = [v for v in current_face_verts if v not in current_strip[-2:]]
-        if current_strip:
-            face_to_add = tuple(current_strip[-2:]) + tuple(strip_indices)
-            if face_to_add != current_face_verts and face_to_add != tuple(reversed(current_face_verts)):
-                # we arrived here because the current face shares and edge with the face in the strip
-                # however, if we just add the verts, we would be changing the direction of the face
-                # so we create a degenerate triangle before adding to it to the strip
-                current_strip.append(current_strip[-2])
-        current_strip.extend(strip_indices)
-        done_faces_indices.add(current_face_index)
-
-        next_face_index = None
-        possible_face_indices = {}
-        for edge in current_face.edge_keys:
-            if edge not in edges_faces:
+    next_start = 0
+
+    while True:
+        while next_start < face_count and visited[next_start]:
+            next_start += 1
+        if next_start == face_count:
+            break
+        visited[next_start] = 1
+        x, y, z = tris[next_start]
+        # start with the rotation whose last edge can be continued, if any
+        strip = [x, y, z]
+        for u, v, w in ((x, y, z), (y, z, x), (z, x, y)):
+            face_index = edges_faces.get(w * n + v)
+            if face_index is not None and not visited[face_index]:
+                strip = [u, v, w]
+                break
+
+        while True:
+            p, q = strip[-2], strip[-1]
+            face_index = edges_faces.get(p * n + q if len(strip) % 2 == 0 else q * n + p)
+            if face_index is not None and not visited[face_index]:
+                visited[face_index] = 1
+                strip.append(sum(tris[face_index]) - p - q)
                 continue
-            checked_edge = {face_index: edge for face_index in edges_faces[edge]
-                            if face_index != current_face_index and face_index not in done_faces_indices}
-            possible_face_indices.update(checked_edge)
-        for face_index, edge in possible_face_indices.items():
-            if not current_strip:
-                next_face_index = face_index
+            if not allow_jumps:
                 break
-            elif edge == tuple(current_strip[-2:]) or edge == tuple(reversed(current_strip[-2:])):
-                next_face_index = face_index
+            while cursors[q] < ends[q] and visited[vertex_faces[cursors[q]]]:
+                cursors[q] += 1
+            jump = None
+            # prefer a face that can be continued after the jump
+            for candidate in vertex_faces[cursors[q]:ends[q]]:
+                if visited[candidate]:
+                    continue
+                t = tris[candidate]
+                j = t.index(q)
+                x = t[(j + 1) % 3] if len(strip) % 2 == 0 else t[j - 1]
+                third = sum(t) - q - x
+                next_face_index = edges_faces.get(x * n + third if len(strip) % 2 else third * n + x)
+                can_continue = next_face_index is not None and not visited[next_face_index]
+                if jump is None or can_continue:
+                    jump = (candidate, x, third)
+                if can_continue:
+                    break
+            if jump is None:
                 break
-            elif edge == (current_strip[-1], current_strip[-2]):
-                if len(current_strip) % 2 != 0:
-                    # create a degenerate triangle to join them
-                    current_strip.append(current_strip[-2])
-                next_face_index = face_index
-
-        if next_face_index:
-            faces_indices.remove(next_face_index)
-            current_face_index = next_face_index
-        else:
-            strips.append(current_strip)
-            current_strip = []
-            try:
-                current_face_index = faces_indices.popleft()
-            except IndexError:
-                process_faces = False
+            face_index, x, third = jump
+            visited[face_index] = 1
+            # the degenerate (.., q, q, x) makes (q, x) the last edge, in the direction needed
+            strip.extend((q, x, third))
+
+        strips.append(strip)
 
     prev_strip_len = 0
+    joined_strips = []
     # join strips with degenerate triangles
     for strip in strips:
         if not prev_strip_len:
             joined_strips.extend(strip)
-            prev_strip_len = len(strip)
         elif prev_strip_len % 2 == 0:
             joined_strips.extend((joined_strips[-1], strip[0]))
             joined_strips.extend(strip)
-            prev_strip_len = len(strip)
         else:
             joined_strips.extend((joined_strips[-1], strip[0], strip[0]))
             joined_strips.extend(strip)
-            prev_strip_len = len(strip)
+        prev_strip_len = len(strip)
 
-    return joined_strips
+    return np.array(joined_strips, dtype=np.int32)
 
 
 def get_textures_from_the_material(blender_material):
@@ -232,48 +261,99 @@ def get_vertex_count_from_blender_objects(blender_objects):
     return sum([len(ob.data.vertices) for ob in blender_objects if ob.type == 'MESH'])
 
 
-def get_bone_indices_and_weights_per_vertex(blender_object):
+def get_bone_weights_per_vertex(blender_object):
     """
-    Return {vertex_index: [(bone_index, weight_value), ...]}
+    Return (bone_indices, weights, has_groups): dense (vertex_count, K) arrays with the
+    armature bone indices and the weights of each vertex, in the order of `vertex.groups`.
+    Groups with zero weight are skipped and the rows are padded with bone -1 and weight 0;
+    `has_groups` tells the vertices that are in any vertex group, even with zero weight.
     """
-    vertex_groups = blender_object.vertex_groups
+    vertex_count = len(blender_object.data.vertices)
     modifiers = {m.type: m for m in blender_object.modifiers}
-    weights_per_vertex = {}
     if blender_object.type != 'MESH':
         raise TypeError('Blender object is not a mesh')
-    if not vertex_groups or 'ARMATURE' not in modifiers:
-        return weights_per_vertex
+    no_weights = (np.full((vertex_count, 0), -1, dtype=np.int64), np.zeros((vertex_count, 0)),
+                  np.zeros(vertex_count, dtype=bool))
+    if not blender_object.vertex_groups or 'ARMATURE' not in modifiers:
+        return no_weights
     armature = modifiers['ARMATURE'].object.data
     bone_names_to_index = {b.name: i for i, b in enumerate(armature.bones)}
     # https://www.blender.org/api/blender_python_api_current/bpy.types.VertexGroupElement.html
+    # The API has no bulk access to vertex group weights (there's no foreach_get across
+    # vertices, and VertexGroup.weight() is per vertex), so this stays one Python step per
+    # membership; everything after it works on the arrays
+    memberships = np.array([(vertex.index, group.group, group.weight)
+                            for vertex in blender_object.data.vertices for group in vertex.groups],
+                           dtype=np.float64).reshape(-1, 3)
+    if not len(memberships):
+        return no_weights
+    vertex_indices = memberships[:, 0].astype(np.int64)
+    group_indices = memberships[:, 1].astype(np.int64)
+    weights = memberships[:, 2]
+    has_groups = np.zeros(vertex_count, dtype=bool)
+    has_groups[vertex_indices] = True
+
+    weighted = weights != 0
+    vertex_indices = vertex_indices[weighted]
+    group_indices = group_indices[weighted]
+    weights = weights[weighted]
+    # bones in blender are matched to vertex group only by name
     vertex_groups = blender_object.vertex_groups
-    for vertex in blender_object.data.vertices:
-        for group in vertex.groups:
-            weights_per_vertex.setdefault(vertex.index, [])
-            if not group.weight:
-                continue
-            # avoiding list comprehensions for readability
-            # bones in blender are matched to vertex group only by name
-            vgroup_name = vertex_groups[group.group].name
-            bone_index = bone_names_to_index[vgroup_name]
-            pair = (bone_index, group.weight)
-            weights_per_vertex[vertex.index].append(pair)
-    return weights_per_vertex
-
-
-def get_uvs_per_vertex(blender_mesh_object, layer_index):
-    '''get .mod return dictionaly with UV'''
-    vertices = {}  # vertex_index: (uv_x, uv_y)
+    used_groups = np.unique(group_indices)
+    group_to_bone = np.full(used_groups.max(initial=-1) + 1, -1, dtype=np.int64)
+    group_to_bone[used_groups] = [bone_names_to_index[vertex_groups[g].name] for g in used_groups.tolist()]
+
+    # memberships come vertex after vertex, number them inside each vertex
+    counts = np.bincount(vertex_indices, minlength=vertex_count)
+    columns = np.arange(len(vertex_indices)) - np.repeat(np.cumsum(counts) - counts, counts)
+    bone_indices = np.full((vertex_count, counts.max(initial=0)), -1, dtype=np.int64)
+    weights_per_vertex = np.zeros(bone_indices.shape)
+    bone_indices[vertex_indices, columns] = group_to_bone[group_indices]
+    weights_per_vertex[vertex_indices, columns] = weights
+    return bone_indices, weights_per_vertex, has_groups
+
+
+def get_loop_vertex_indices(blender_mesh):
+    loop_vertex_indices = np.empty(len(blender_mesh.loops), dtype=np.int32)
+    blender_mesh.loops.foreach_get('vertex_index', loop_vertex_indices)
+    return loop_vertex_indices
+
+
+def get_first_loop_per_vertex(blender_mesh):
+    """Index of the first loop using each vertex, -1 for vertices without loops"""
+    loop_vertex_indices = get_loop_vertex_indices(blender_mesh)
+    vertex_indices, loop_indices = np.unique(loop_vertex_indices, return_index=True)
+    first_loops = np.full(len(blender_mesh.vertices), -1, dtype=np.int64)
+    first_loops[vertex_indices] = loop_indices
+    return first_loops
+
+
+def get_per_vertex_from_loops(loop_values, first_loops, default):
+    """
+    (vertex_count, n) values of the first loop of each vertex from the (loop_count, n)
+    `loop_values`, `default` for the vertices without loops
+    """
+    values = np.full((len(first_loops), loop_values.shape[1]), default, dtype=loop_values.dtype)
+    has_loops = first_loops != -1
+    values[has_loops] = loop_values[first_loops[has_loops]]
+    return values
+
+
+def get_uvs_per_vertex(blender_mesh, layer_index, first_loops=None):
+    """
+    (vertex_count, 2) uvs of the first loop of each vertex and a mask of the vertices that have
+    one, or None if the layer doesn't exist or is empty. `first_loops` can be passed when it's
+    already computed, see `get_first_loop_per_vertex`.
+    """
     try:
-        uv_layer = blender_mesh_object.data.uv_layers[layer_index]
+        uv_layer = blender_mesh.uv_layers[layer_index]
     except IndexError:
-        return vertices
-    uvs_per_loop = uv_layer.data
-    for i, loop in enumerate(blender_mesh_object.data.loops):
-        vertex_index = loop.vertex_index
-        if vertex_index in vertices:
-            continue
-        else:
-            uvs = uvs_per_loop[i].uv
-            vertices[vertex_index] = (uvs[0], uvs[1])
-    return vertices
\ No newline at end of file
+        return None
+    if not len(blender_mesh.loops):
+        return None
+    if first_loops is None:
+        first_loops = get_first_loop_per_vertex(blender_mesh)
+    loop_uvs = np.empty(len(blender_mesh.loops) * 2, dtype=np.float32)
+    uv_layer.data.foreach_get('uv', loop_uvs)
+    uvs = get_per_vertex_from_loops(loop_uvs.reshape(-1, 2), first_loops, np.nan)
+    return uvs, first_loops != -1
\ No newline at end of file
@@ -0,0 +1,127 @@
+try:
+    import numpy as np
+except ImportError:
+    pass
+
+
+RITTER_MAX_ITERATIONS = 64
+
+
+def get_bounding_box(points):
+    """Return the (min, max) corners of the axis aligned bounding box of `points` (N, 3)"""
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    return points.min(axis=0), points.max(axis=0)
+
+
+def get_bounding_sphere(points, tight=False):
+    """
+    Return the (center, radius) of a sphere containing all `points` (N, 3).
+    By default the sphere is centered in the bounding box. With `tight` a sphere
+    is also fitted with Ritter's algorithm and the smaller of both is returned,
+    so objects get culled less aggressively.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    box_min, box_max = get_bounding_box(points)
+    center = (box_min + box_max) / 2
+    radius = get_distances(points, center).max()
+    if tight:
+        ritter_center, ritter_radius = get_ritter_sphere(points)
+        if ritter_radius < radius:
+            return ritter_center, ritter_radius
+    return center, radius
+
+
+def get_ritter_sphere(points):
+    """
+    Ritter's bounding sphere: start with the sphere over two distant points and grow it
+    towards the farthest point outside until all points are inside. Each step looks at all
+    the points at once; after RITTER_MAX_ITERATIONS steps the radius is just extended.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    point_a = points[get_distances(points, points[0]).argmax()]
+    point_b = points[get_distances(points, point_a).argmax()]
+    center = (point_a + point_b) / 2
+    radius = get_distances(point_b[None], point_a)[0] / 2
+
+    for _ in range(RITTER_MAX_ITERATIONS):
+        distances = get_distances(points, center)
+        farthest = distances.argmax()
+        distance = distances[farthest]
+        if distance <= radius:
+            break
+        new_radius = (radius + distance) / 2
+        center = center + (points[farthest] - center) * ((new_radius - radius) / distance)
+        radius = new_radius
+    # rounding while moving the center can leave points barely outside
+    return center, max(radius, get_distances(points, center).max())
+
+
+def get_distances(points, point):
+    """Euclidean distances from every point in `points` (N, 3) to `point`"""
+    delta = points - point
+    return np.sqrt(delta[:, 0] * delta[:, 0] + delta[:, 1] * delta[:, 1] + delta[:, 2] * delta[:, 2])
+
+
+def get_oriented_bounding_boxes(points, groups, group_count, refine=False):
+    """
+    Fit an oriented bounding box to the points of each group, all the groups at once.
+    `points` (N, 3) belong to `groups` (N,), with every group in range(group_count) having points.
+    The box axes come from the principal components of the points (PCA); the axis aligned
+    box is kept instead when it isn't bigger. With `refine`, rotations of the PCA axes
+    around each of them are tried as well, keeping the smallest box.
+    Return (axes, centers, half_extents): axes (G, 3, 3) has the axes of each box as rows,
+    so a point `p` of group `g` is inside its box when
+    abs((p - centers[g]) @ axes[g].T) <= half_extents[g].
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    groups = np.asarray(groups, dtype=np.intp)
+    if not group_count:
+        return np.empty((0, 3, 3)), np.empty((0, 3)), np.empty((0, 3))
+    order = np.argsort(groups, kind='stable')
+    points = points[order]
+    groups = groups[order]
+    counts = np.bincount(groups, minlength=group_count)
+    starts = np.cumsum(counts) - counts
+
+    means = np.stack([np.bincount(groups, weights=points[:, i], minlength=group_count) for i in range(3)], axis=1)
+    means /= counts[:, None]
+    centered = points - means[groups]
+    covariances = np.empty((group_count, 3, 3))
+    for i in range(3):
+        for j in range(i, 3):
+            covariances[:, i, j] = covariances[:, j, i] = np.bincount(
+                groups, weights=centered[:, i] * centered[:, j], minlength=group_count)
+    _, eigenvectors = np.linalg.eigh(covariances)
+    pca_axes = eigenvectors.transpose(0, 2, 1).copy()
+    pca_axes[np.linalg.det(pca_axes) < 0, 2] *= -1  # keep them a rotation
+
+    candidates = [np.broadcast_to(np.eye(3), (group_count, 3, 3)), pca_axes]
+    if refine:
+        for angle in np.linspace(0, np.pi / 2, 9)[1:-1]:
+            cos, sin = np.cos(angle), np.sin(angle)
+            for axis in range(3):
+                i, j = [k for k in range(3) if k != axis]
+                rotated = pca_axes.copy()
+                rotated[:, i] = cos * pca_axes[:, i] + sin * pca_axes[:, j]
+                rotated[:, j] = cos * pca_axes[:, j] - sin * pca_axes[:, i]
+                candidates.append(rotated)
+
+    best_axes = best_centers = best_half_extents = best_volumes = None
+    for candidate_axes in candidates:
+        local = np.einsum('nj,nij->ni', points, candidate_axes[groups])
+        local_min = np.minimum.reduceat(local, starts)
+        local_max = np.maximum.reduceat(local, starts)
+        half_extents = (local_max - local_min) / 2
+        centers = np.einsum('gi,gij->gj', (local_min + local_max) / 2, candidate_axes)
+        volumes = np.prod(half_extents, axis=1)
+        if best_volumes is None:
+            # the axis aligned box, only replaced by clearly smaller ones
+            best_axes, best_centers, best_half_extents = candidate_axes.copy(), centers, half_extents
+            best_volumes = volumes * (1 - 1e-6)
+            continue
+        smaller = volumes < best_volumes
+        best_axes[smaller] = candidate_axes[smaller]
+        best_centers[smaller] = centers[smaller]
+        best_half_extents[smaller] = half_extents[smaller]
+        best_volumes[smaller] = volumes[smaller]
+    return best_axes, best_centers, best_half_extents
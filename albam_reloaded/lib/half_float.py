@@ -1,65 +1,60 @@
-import binascii
-import struct
+try:
+    import numpy as np
+except ImportError:
+    pass
+
+
+F16_EXPONENT_BITS = 0x1F
+F16_EXPONENT_SHIFT = 10
+F16_EXPONENT_BIAS = 15
+F16_MANTISSA_BITS = 0x3ff
+F16_MANTISSA_SHIFT = 23 - F16_EXPONENT_SHIFT
+F16_MAX_EXPONENT = (F16_EXPONENT_BITS << F16_EXPONENT_SHIFT)
+
+
+def unpack_half_floats(float16_array):
+    """
+    Decode an array of half-floats given as their uint16 bit patterns (used in the uv coords)
+    into a float32 array.
+    Compatible with the previous per-value decoder: -0.0 and inf/nan decode to the
+    float32 bit pattern they'd have, as a number (e.g. -0.0 -> 2147483648.0)
+    """
+    bits = np.atleast_1d(np.asarray(float16_array, dtype=np.uint16))
+    floats = bits.view(np.float16).astype(np.float32)
+    special = (bits == 0x8000) | ((bits & 0x7c00) == 0x7c00)
+    if special.any():
+        b = bits[special].astype(np.uint32)
+        inf_nan = 0x7f800000 | ((b & F16_MANTISSA_BITS) << F16_MANTISSA_SHIFT)
+        floats[special] = ((b & 0x8000) << 16) | np.where((b & 0x7c00) == 0x7c00, inf_nan, 0)
+    return floats
+
+
+def pack_half_floats(float_array):
+    """
+    Encode an array of floats into half-floats, returned as a uint16 array with their bit
+    patterns. The mantissa is truncated, and values too small for a normalized half-float
+    are flushed to (signed) zero
+    """
+    f32 = np.atleast_1d(np.asarray(float_array, dtype=np.float32)).view(np.uint32)
+    sign = ((f32 >> 16) & 0x8000).astype(np.uint16)
+    exponent = ((f32 >> 23) & 0xff).astype(np.int32) - 127
+    mantissa = f32 & 0x007fffff
+
+    f16 = sign.copy()
+    inf_nan = exponent == 128
+    f16[inf_nan] |= (F16_MAX_EXPONENT | (mantissa[inf_nan] & F16_MANTISSA_BITS)).astype(np.uint16)
+    f16[(exponent > 15) & ~inf_nan] |= F16_MAX_EXPONENT
+    normal = (exponent > -15) & (exponent <= 15)
+    f16[normal] |= (((exponent[normal] + F16_EXPONENT_BIAS) << F16_EXPONENT_SHIFT) |
+                    (mantissa[normal] >> F16_MANTISSA_SHIFT)).astype(np.uint16)
+    return f16
 
 
 def unpack_half_float(float16):
     # A function useful to read half-float (used in the uv coords), not supported by the struct module
-    # http://davidejones.com/blog/1413-python-precision-floating-point/
-
-    # TODO: check limitations on the input and raise exceptions
-    # http://read.pudn.com/downloads95/sourcecode/graph/385756/1/BaseLib/float16.h__.htm
     # https://en.wikipedia.org/wiki/Half-precision_floating-point_format
-    s = int((float16 >> 15) & 0x00000001)  # sign
-    e = int((float16 >> 10) & 0x0000001f)  # exponent
-    f = int(float16 & 0x000003ff)  # fraction
-    if e == 0:
-        if f == 0:
-            return float(s << 31)
-        else:
-            while not (f & 0x00000400):
-                f = f << 1
-                e -= 1
-            e += 1
-            f &= ~0x00000400
-    elif e == 31:
-        if f == 0:
-            return int((s << 31) | 0x7f800000)
-        else:
-            return int((s << 31) | 0x7f800000 | (f << 13))
-    e = e + (127 - 15)
-    f = f << 13
-    short_int = int((s << 31) | (e << 23) | f)
-    return struct.unpack('f', struct.pack('I', short_int))[0]
+    return float(unpack_half_floats(float16)[0])
 
 
 def pack_half_float(float32):
-    F16_EXPONENT_BITS = 0x1F
-    F16_EXPONENT_SHIFT = 10
-    F16_EXPONENT_BIAS = 15
-    F16_MANTISSA_BITS = 0x3ff
-    F16_MANTISSA_SHIFT = 23 - F16_EXPONENT_SHIFT
-    F16_MAX_EXPONENT = (F16_EXPONENT_BITS << F16_EXPONENT_SHIFT)
-
-    a = struct.pack('>f', float32)
-    b = binascii.hexlify(a)
-
-    f32 = int(b, 16)
-    f16 = 0
-    sign = (f32 >> 16) & 0x8000
-    exponent = ((f32 >> 23) & 0xff) - 127
-    mantissa = f32 & 0x007fffff
-
-    if exponent == 128:
-        f16 = sign | F16_MAX_EXPONENT
-        if mantissa:
-            f16 |= (mantissa & F16_MANTISSA_BITS)
-    elif exponent > 15:
-        f16 = sign | F16_MAX_EXPONENT
-    elif exponent > -15:
-        exponent += F16_EXPONENT_BIAS
-        mantissa >>= F16_MANTISSA_SHIFT
-        f16 = sign | exponent << F16_EXPONENT_SHIFT | mantissa
-    else:
-        f16 = sign
-
-    return f16
+    return int(pack_half_floats(float32)[0])
@@ -1,12 +1,9 @@
+from concurrent.futures import ThreadPoolExecutor
 import ntpath
 import os
 import posixpath
 
 
-def chunks(l, n):
-    return [l[i:i + n] for i in range(0, len(l), n)]
-
-
 def ensure_posixpath(path):
     '''If the path given is not posix, convert it and return it, else return it'''
     splitted = path.split(ntpath.sep)
@@ -36,3 +33,15 @@ def find_files(root_dir, extension=None):
     """
     return [os.path.join(root, f) for root, _, files in os.walk(root_dir)
             for f in files if not extension or (extension and f.endswith(extension))]
+
+
+def map_in_pool(func, iterable, workers=None):
+    """
+    Like map(), but spreading the calls over `workers` threads. Results keep the order
+    of `iterable`, so the output doesn't depend on the number of workers.
+    Threads are enough since the heavy lifting (zlib, file I/O) releases the GIL.
+    """
+    if not workers or workers < 2:
+        return list(map(func, iterable))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(func, iterable))
@@ -1,6 +1,7 @@
 from copy import copy
 import ctypes
 from ctypes import c_float
+from functools import lru_cache
 import os
 
 
@@ -10,39 +11,83 @@ class DynamicStructure:
 
     # TODO: change signature to make it clear that 'file_path' can be also a buffer
     def __new__(cls, file_path=None, *args, **kwargs):
-        cls_dict = {'_pack_': 1}
-        cls_dict.update(cls.__dict__)
-        cls_dict['_fields_'] = parse_fields(cls._fields_, file_path, **kwargs)
-
-        try:
-            generated_cls = type('Gen{}'.format(cls.__name__), (ctypes.Structure,), cls_dict)
-        except TypeError:
-            raise RuntimeError('Error generating class. Fields: {}'.format(cls_dict['_fields_']))
-
         if file_path:
-            instance = generated_cls()
+            instance = cls.from_buffer(read_buffer(file_path))
             instance._file_path = file_path  # TODO: move to 'meta' attribute.
-            try:
-                with open(file_path, 'rb') as f:
-                    f.readinto(instance)
-            except TypeError:
-                file_path.readinto(instance)
-                file_path.close()
         else:
-            instance = generated_cls(**kwargs)
+            instance = get_generated_class(cls, parse_fields(cls._fields_, **kwargs))(**kwargs)
 
         return instance
 
+    @classmethod
+    def from_buffer(cls, buff, offset=0):
+        """
+        Map the structure over any object supporting the buffer protocol (bytes, bytearray,
+        memoryview, mmap...), starting at `offset`. Writable buffers are shared, not copied,
+        so changes to the instance are visible in `buff` and vice versa. Read-only buffers
+        and buffers shorter than the structure (the rest is zeroed) are copied once.
+        """
+        view = memoryview(buff).cast('B')[offset:]
+        if view.readonly:
+            view = bytearray(view)
+        generated_cls = get_generated_class(cls, parse_fields(cls._fields_, view))
+        missing = ctypes.sizeof(generated_cls) - len(view)
+        if missing > 0:
+            # same as readinto() on a short file
+            view = bytearray(view)
+            view.extend(bytes(missing))
+        return generated_cls.from_buffer(view)
+
+
+@lru_cache(maxsize=512)
+def get_generated_class(cls, fields):
+    """
+    ctypes.Structure with the resolved `fields` of `cls`. Classes are memoized,
+    so all the instances with the same layout share the same class.
+    """
+    cls_dict = {'_pack_': 1}
+    cls_dict.update(cls.__dict__)
+    cls_dict['_fields_'] = fields
 
-def parse_fields(sequence_of_tuples, file_path_or_buffer=None, **kwargs):
-    ready_fields = []
     try:
-        os.path.isfile(file_path_or_buffer)
-        is_file = True
-        buff = open(file_path_or_buffer, 'rb')
+        return type('Gen{}'.format(cls.__name__), get_generated_bases(cls), cls_dict)
     except TypeError:
-        buff = file_path_or_buffer
-        is_file = False
+        raise RuntimeError('Error generating class. Fields: {}'.format(fields))
+
+
+def get_generated_bases(cls):
+    """Bases of the ctypes class generated for `cls`: its mixins, if any, and ctypes.Structure"""
+    return tuple(base for base in cls.__bases__ if not issubclass(base, DynamicStructure)) + (ctypes.Structure,)
+
+
+@lru_cache(maxsize=1024)
+def get_prefix_class(fields):
+    """Structure with the fields already resolved, used to evaluate the callable ones"""
+    class TmpStruct(ctypes.Structure):
+        _fields_ = fields
+        _pack_ = 1
+    return TmpStruct
+
+
+def read_buffer(file_path_or_buffer):
+    """Read a file path or a file object (from its current position) into a bytearray"""
+    try:
+        size = os.path.getsize(file_path_or_buffer)
+    except TypeError:
+        return bytearray(file_path_or_buffer.read())
+    buff = bytearray(size)
+    with open(file_path_or_buffer, 'rb') as f:
+        f.readinto(buff)
+    return buff
+
+
+def parse_fields(sequence_of_tuples, buff=None, **kwargs):
+    """
+    Resolve the callable fields, in a single pass over `buff`: each one is called with
+    the fields parsed so far and, if it takes a second argument, with `buff` itself
+    (None when building from `kwargs`).
+    """
+    ready_fields = []
 
     for t in sequence_of_tuples:
         attr_name = t[0]
@@ -51,25 +96,21 @@ def parse_fields(sequence_of_tuples, file_path_or_buffer=None, **kwargs):
             ctypes.sizeof(ctype_or_callable)
             ready_fields.append(t)
         except TypeError:
-            class TmpStruct(ctypes.Structure):
-                _fields_ = ready_fields
-                _pack_ = 1
-            if buff:
-                tmp_struct = TmpStruct()
-                buff.readinto(tmp_struct)
-                buff.seek(0)
-            else:
+            TmpStruct = get_prefix_class(tuple(ready_fields))
+            if buff is None:
                 tmp_struct = TmpStruct(**kwargs)
+            elif len(buff) >= ctypes.sizeof(TmpStruct):
+                tmp_struct = TmpStruct.from_buffer(buff)
+            else:
+                tmp_struct = TmpStruct.from_buffer_copy(bytes(buff) + bytes(ctypes.sizeof(TmpStruct) - len(buff)))
             try:
                 c_type = ctype_or_callable(tmp_struct)
             except TypeError:
-                c_type = ctype_or_callable(tmp_struct, file_path_or_buffer)
+                c_type = ctype_or_callable(tmp_struct, buff)
+            del tmp_struct
 
             ready_fields.append((attr_name, c_type))
 
-    if file_path_or_buffer and is_file:
-        buff.close()
-
     return tuple(ready_fields)
 
 
@@ -1,4 +1,3 @@
-from io import BytesIO
 from ..engines.mtframework.mod_156 import Mod156
 
 try:
@@ -350,7 +349,7 @@ def rename_bones(armature):
     pose_bones = armature.pose.bones
     armature_name = armature.name
     parent_blender_object = armature.parent
-    saved_mod = Mod156(file_path=BytesIO(parent_blender_object.albam_imported_item.data))
+    saved_mod = Mod156.from_buffer(parent_blender_object.albam_imported_item.data)
     bones_array = saved_mod.bones_array
     bone_map_array = bone_mapping
     if not armature_name.find("evf") == -1:
@@ -0,0 +1,67 @@
+"""
+Arc.from_dir and Arc.unpack with different numbers of workers, on a synthetic archive.
+
+    python -m benchmarks.bench_arc [--entries 3000] [--workers 1 2 4 8]
+
+The archives written are also checked to be byte-identical for every number of workers.
+"""
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from albam_reloaded.engines.mtframework.arc import Arc
+
+
+def make_source_dir(path, entries, seed=0):
+    """`entries` files of 4-32 KiB of compressible data, like the ones in character arcs"""
+    rng = random.Random(seed)
+    words = [bytes(rng.getrandbits(8) for _ in range(rng.randint(2, 12))) for _ in range(256)]
+    for i in range(entries):
+        file_path = os.path.join(path, 'pawn', 'pl', 'pl{:02}'.format(i % 50), 'entry{:05}.mod'.format(i))
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        size = rng.randint(4096, 32768)
+        data = bytearray()
+        while len(data) < size:
+            data += rng.choice(words)
+        with open(file_path, 'wb') as w:
+            w.write(data[:size])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--entries', type=int, default=3000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        source_dir = os.path.join(tmp_dir, 'source')
+        make_source_dir(source_dir, args.entries)
+        print('{} entries, {} CPUs'.format(args.entries, os.cpu_count()))
+
+        arcs = {}
+        for workers in args.workers:
+            start = time.perf_counter()
+            arcs[workers] = bytes(Arc.from_dir(source_dir, workers=workers))
+            print('from_dir workers={}: {:.3f}s'.format(workers, time.perf_counter() - start))
+        assert len(set(arcs.values())) == 1, 'archives differ between number of workers'
+        arc_path = os.path.join(tmp_dir, 'bench.arc')
+        with open(arc_path, 'wb') as w:
+            w.write(arcs[args.workers[0]])
+        print('archive: {:.1f} MB, identical for all workers'.format(os.path.getsize(arc_path) / 1e6))
+
+        for workers in args.workers:
+            output_dir = os.path.join(tmp_dir, 'unpacked_{}'.format(workers))
+            with Arc.open(arc_path) as arc:
+                start = time.perf_counter()
+                arc.unpack(output_dir, workers=workers)
+                print('unpack workers={}: {:.3f}s'.format(workers, time.perf_counter() - start))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main()
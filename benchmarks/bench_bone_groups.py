@@ -0,0 +1,71 @@
+"""
+Bone group and layer assignment on a 200 bone armature: _create_bone_groups against the
+previous implementation, which selected each bone and called bpy.ops.pose.bone_layers.
+Needs Blender (2.80 to 3.6, bone groups and layers were removed in 4.0):
+
+    blender --background --factory-startup --python benchmarks/bench_bone_groups.py -- [--bones 200]
+"""
+import argparse
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+import bpy
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from albam_reloaded.engines.mtframework.blender_import import _create_bone_groups  # noqa: E402
+from albam_reloaded.engines.mtframework.mappers import BONE_INDEX_TO_GROUP  # noqa: E402
+
+
+def previous_create_bone_groups(armature_ob, mod):
+    # the operator based version replaced by _create_bone_groups, groups simplified to one per name
+    bone_groups = {}
+    bpy.ops.object.mode_set(mode='POSE')
+    for i, bone in enumerate(armature_ob.pose.bones):
+        group_name = BONE_INDEX_TO_GROUP.get(mod.bones_array[i].anim_map_index, 'OTHER')
+        if group_name not in bone_groups:
+            bone_groups[group_name] = armature_ob.pose.bone_groups.new(name=group_name)
+        layers = [False] * 32
+        layers[0] = layers[list(bone_groups).index(group_name) + 1] = True
+        armature_ob.data.bones[i].select = True
+        bpy.ops.pose.bone_layers(layers=layers)
+        armature_ob.data.bones[i].select = False
+        bone.bone_group = bone_groups[group_name]
+    bpy.ops.object.mode_set(mode='OBJECT')
+
+
+def create_armature(bone_count):
+    armature = bpy.data.armatures.new('bench')
+    armature_ob = bpy.data.objects.new('bench', armature)
+    bpy.context.collection.objects.link(armature_ob)
+    bpy.context.view_layer.objects.active = armature_ob
+    bpy.ops.object.mode_set(mode='EDIT')
+    for i in range(bone_count):
+        bone = armature.edit_bones.new(str(i))
+        bone.head = (0, i, 0)
+        bone.tail = (0, i, 1)
+    bpy.ops.object.mode_set(mode='OBJECT')
+    anim_indices = sorted(BONE_INDEX_TO_GROUP)
+    mod = SimpleNamespace(bones_array=[SimpleNamespace(anim_map_index=anim_indices[i % len(anim_indices)])
+                                       for i in range(bone_count)])
+    return armature_ob, mod
+
+
+def main():
+    argv = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else []
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--bones', type=int, default=200)
+    args = parser.parse_args(argv)
+
+    for label, func in (('bpy.ops.pose.bone_layers per bone', previous_create_bone_groups),
+                        ('_create_bone_groups', _create_bone_groups)):
+        armature_ob, mod = create_armature(args.bones)
+        start = time.perf_counter()
+        func(armature_ob, mod)
+        print('{} bones, {}: {:.3f}s'.format(args.bones, label, time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    main()
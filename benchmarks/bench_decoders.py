@@ -0,0 +1,46 @@
+"""
+Decoding a 2048x2048 DXT5 (and DXT1, bgra8) texture with image_formats.decoders.
+
+    python -m benchmarks.bench_decoders [--size 2048] [--repeat 5]
+
+The data is random: the decoders do the same work for every block, whatever its content.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from albam_reloaded.image_formats.decoders import decode_image
+
+
+FORMATS = (
+    (b'DXT5', 16),  # bytes per 4x4 block
+    (b'DXT1', 8),
+    (b'', 64),  # bgra8, 4 bytes per pixel
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=2048)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    blocks = (args.size // 4) ** 2
+    for fmt, block_size in FORMATS:
+        data = rng.integers(0, 256, blocks * block_size, dtype=np.uint8).tobytes()
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            image = decode_image(data, args.size, args.size, fmt)
+            timings.append(time.perf_counter() - start)
+        assert image.shape == (args.size, args.size, 4)
+        best = min(timings)
+        print('{} {}x{}: {:.3f}s best of {} ({:.0f} Mpixels/s)'.format(
+            fmt.decode('ascii') or 'bgra8', args.size, args.size, best, args.repeat,
+            args.size * args.size / best / 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+"""
+Throughput of unpack_half_floats / pack_half_floats against the per value functions they
+replaced (kept in tests/test_half_float.py as the reference for the parity tests).
+
+    python -m benchmarks.bench_half_float [--values 1000000]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from albam_reloaded.lib.half_float import pack_half_floats, unpack_half_floats
+from tests.test_half_float import reference_pack_half_float, reference_unpack_half_float
+
+
+def measure(label, func, count):
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print('{}: {:.3f}s ({:.1f} M values/s)'.format(label, elapsed, count / elapsed / 1e6))
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--values', type=int, default=1000000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    halfs = rng.integers(0, 1 << 16, args.values, dtype=np.uint16)
+    floats = rng.uniform(-2, 2, args.values).astype(np.float32)
+    halfs_list = halfs.tolist()
+    floats_list = floats.tolist()
+
+    old = measure('unpack, per value', lambda: [reference_unpack_half_float(h) for h in halfs_list], args.values)
+    new = measure('unpack_half_floats', lambda: unpack_half_floats(halfs), args.values)
+    print('unpack speedup: {:.0f}x'.format(old / new))
+    old = measure('pack, per value', lambda: [reference_pack_half_float(f) for f in floats_list], args.values)
+    new = measure('pack_half_floats', lambda: pack_half_floats(floats), args.values)
+    print('pack speedup: {:.0f}x'.format(old / new))
+
+
+if __name__ == '__main__':
+    main()
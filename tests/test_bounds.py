@@ -0,0 +1,105 @@
+import numpy as np
+import pytest
+
+from albam_reloaded.lib.bounds import get_oriented_bounding_boxes
+
+
+def random_groups(rng, group_count):
+    """Points of `group_count` groups, each a randomly rotated, stretched and moved blob"""
+    points = []
+    groups = []
+    for group in range(group_count):
+        count = int(rng.integers(1, 200))
+        rotation = np.linalg.qr(rng.normal(size=(3, 3)))[0]
+        scale = rng.uniform(0.01, 5, 3)
+        points.append((rng.normal(size=(count, 3)) * scale) @ rotation + rng.normal(size=3) * 10)
+        groups.extend([group] * count)
+    return np.concatenate(points), np.array(groups)
+
+
+def local_coordinates(points, groups, axes, centers):
+    return np.einsum('nj,nij->ni', points - centers[groups], axes[groups])
+
+
+@pytest.mark.parametrize('refine', [False, True])
+@pytest.mark.parametrize('seed', range(5))
+def test_every_point_inside_its_box(seed, refine):
+    rng = np.random.default_rng(seed)
+    group_count = int(rng.integers(1, 300))
+    points, groups = random_groups(rng, group_count)
+    # groups don't need to be sorted
+    shuffle = rng.permutation(len(points))
+    points, groups = points[shuffle], groups[shuffle]
+
+    axes, centers, half_extents = get_oriented_bounding_boxes(points, groups, group_count, refine=refine)
+
+    assert axes.shape == (group_count, 3, 3)
+    assert centers.shape == half_extents.shape == (group_count, 3)
+    outside = np.abs(local_coordinates(points, groups, axes, centers)) - half_extents[groups]
+    assert outside.max() <= 1e-9
+
+
+@pytest.mark.parametrize('refine', [False, True])
+def test_axes_are_rotations(refine):
+    rng = np.random.default_rng(0)
+    points, groups = random_groups(rng, 50)
+
+    axes, _, _ = get_oriented_bounding_boxes(points, groups, 50, refine=refine)
+
+    assert np.allclose(axes @ axes.transpose(0, 2, 1), np.eye(3))
+    assert np.allclose(np.linalg.det(axes), 1)
+
+
+@pytest.mark.parametrize('refine', [False, True])
+def test_never_bigger_than_the_axis_aligned_box(refine):
+    rng = np.random.default_rng(1)
+    points, groups = random_groups(rng, 100)
+
+    _, _, half_extents = get_oriented_bounding_boxes(points, groups, 100, refine=refine)
+
+    aabb_min = np.array([points[groups == g].min(axis=0) for g in range(100)])
+    aabb_max = np.array([points[groups == g].max(axis=0) for g in range(100)])
+    assert (np.prod(half_extents, axis=1) <= np.prod((aabb_max - aabb_min) / 2, axis=1) * (1 + 1e-9)).all()
+
+
+def test_axis_aligned_box_is_kept():
+    # the corners and the inside of a box, the axis aligned box is already the smallest
+    corners = np.array(np.meshgrid([-1, 1], [-1, 1], [-1, 1])).reshape(3, -1).T
+    inside = np.random.default_rng(2).uniform(-1, 1, (100, 3))
+    points = np.concatenate((corners, inside)) * (3, 1, 0.2) + (5, -2, 1)
+
+    axes, centers, half_extents = get_oriented_bounding_boxes(points, np.zeros(len(points), dtype=int), 1,
+                                                              refine=True)
+
+    assert np.array_equal(axes[0], np.eye(3))
+    assert np.allclose(centers[0], (5, -2, 1))
+    assert np.allclose(half_extents[0], (3, 1, 0.2))
+
+
+def test_rotated_box_is_found():
+    rng = np.random.default_rng(3)
+    rotation = np.linalg.qr(rng.normal(size=(3, 3)))[0]
+    points = (rng.uniform(-1, 1, (5000, 3)) * (2, 0.5, 0.1)) @ rotation.T
+
+    _, _, half_extents = get_oriented_bounding_boxes(points, np.zeros(len(points), dtype=int), 1, refine=True)
+
+    # the true box has a volume of 0.1, its axis aligned one is much bigger
+    assert np.prod(half_extents[0]) < 0.1 * 1.1
+
+
+def test_single_point_groups():
+    points = np.array([(1.0, 2.0, 3.0), (-1.0, 0.0, 0.5)])
+
+    axes, centers, half_extents = get_oriented_bounding_boxes(points, np.array([1, 0]), 2)
+
+    assert np.allclose(centers, points[::-1])
+    assert np.allclose(half_extents, 0)
+
+
+def test_no_groups():
+    axes, centers, half_extents = get_oriented_bounding_boxes(np.empty((0, 3)), np.empty(0, dtype=int), 0,
+                                                              refine=True)
+
+    assert axes.shape == (0, 3, 3)
+    assert centers.shape == (0, 3)
+    assert half_extents.shape == (0, 3)
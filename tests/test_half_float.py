@@ -0,0 +1,109 @@
+import binascii
+import struct
+
+import numpy as np
+import pytest
+
+from albam_reloaded.lib.half_float import (
+    pack_half_float,
+    pack_half_floats,
+    unpack_half_float,
+    unpack_half_floats,
+)
+
+
+def reference_unpack_half_float(float16):
+    # the per value decoder that unpack_half_floats replaced
+    s = int((float16 >> 15) & 0x00000001)
+    e = int((float16 >> 10) & 0x0000001f)
+    f = int(float16 & 0x000003ff)
+    if e == 0:
+        if f == 0:
+            return float(s << 31)
+        else:
+            while not (f & 0x00000400):
+                f = f << 1
+                e -= 1
+            e += 1
+            f &= ~0x00000400
+    elif e == 31:
+        if f == 0:
+            return int((s << 31) | 0x7f800000)
+        else:
+            return int((s << 31) | 0x7f800000 | (f << 13))
+    e = e + (127 - 15)
+    f = f << 13
+    short_int = int((s << 31) | (e << 23) | f)
+    return struct.unpack('f', struct.pack('I', short_int))[0]
+
+
+def reference_pack_half_float(float32):
+    # the per value encoder that pack_half_floats replaced
+    f32 = int(binascii.hexlify(struct.pack('>f', float32)), 16)
+    sign = (f32 >> 16) & 0x8000
+    exponent = ((f32 >> 23) & 0xff) - 127
+    mantissa = f32 & 0x007fffff
+
+    if exponent == 128:
+        f16 = sign | 0x7c00
+        if mantissa:
+            f16 |= (mantissa & 0x3ff)
+    elif exponent > 15:
+        f16 = sign | 0x7c00
+    elif exponent > -15:
+        f16 = sign | (exponent + 15) << 10 | mantissa >> 13
+    else:
+        f16 = sign
+    return f16
+
+
+ALL_HALF_FLOATS = np.arange(1 << 16, dtype=np.uint16)
+
+
+def _float32_samples():
+    """Every half float value, plus random float32 ones of any magnitude (no nan, see below)"""
+    rng = np.random.default_rng(0)
+    samples = np.concatenate((
+        ALL_HALF_FLOATS.view(np.float16).astype(np.float32),
+        rng.integers(0, 1 << 32, 200000, dtype=np.uint64).astype(np.uint32).view(np.float32),
+        rng.uniform(-2, 2, 50000).astype(np.float32),
+        np.array([0.0, -0.0, 65504.0, 65520.0, 1e-8, -1e-8, np.inf, -np.inf], dtype=np.float32),
+    ))
+    return samples[~np.isnan(samples)]
+
+
+def test_unpack_half_floats_matches_reference_on_all_inputs():
+    expected = np.array([reference_unpack_half_float(h) for h in ALL_HALF_FLOATS.tolist()], dtype=np.float64)
+    result = unpack_half_floats(ALL_HALF_FLOATS)
+
+    assert result.dtype == np.float32
+    # compare the bits, so nan payloads and signed zeros count
+    assert np.array_equal(result.view(np.uint32), expected.astype(np.float32).view(np.uint32))
+
+
+def test_unpack_half_float_scalar_matches_reference():
+    for h in (0, 0x8000, 0x3c00, 0xbc00, 0x0001, 0x03ff, 0x7bff, 0x7c00, 0xfc00, 0x7e00):
+        assert unpack_half_float(h) == reference_unpack_half_float(h)
+
+
+def test_pack_half_floats_matches_reference():
+    samples = _float32_samples()
+    expected = np.array([reference_pack_half_float(f) for f in samples.tolist()], dtype=np.uint16)
+    result = pack_half_floats(samples)
+
+    assert result.dtype == np.uint16
+    assert np.array_equal(result, expected)
+
+
+@pytest.mark.parametrize('value', [float('nan'), -float('nan')])
+def test_pack_half_float_nan(value):
+    assert pack_half_float(value) == reference_pack_half_float(value)
+
+
+def test_pack_half_floats_round_trip():
+    # every finite half float survives unpack -> pack
+    finite = ALL_HALF_FLOATS[(ALL_HALF_FLOATS & 0x7c00) != 0x7c00]
+    normal_or_zero = finite[((finite & 0x7c00) != 0) | ((finite & 0x3ff) == 0)]
+    floats = normal_or_zero.view(np.float16).astype(np.float32)
+
+    assert np.array_equal(pack_half_floats(floats), normal_or_zero)
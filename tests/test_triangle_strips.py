@@ -0,0 +1,79 @@
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from albam_reloaded.lib.blender import strip_triangles_to_triangles_list, triangles_to_triangles_strip
+
+
+def grid_triangles(width, height):
+    """Two triangles per quad of a `width` x `height` grid of quads, counter-clockwise"""
+    rows, columns = np.mgrid[:height, :width]
+    v0 = (rows * (width + 1) + columns).ravel()
+    v1, v2, v3 = v0 + 1, v0 + width + 2, v0 + width + 1
+    return np.concatenate((np.stack((v0, v1, v2), axis=1), np.stack((v0, v2, v3), axis=1)))
+
+
+def random_triangles(rng, face_count, vertex_count):
+    """Non degenerate triangles over few vertices, so many of them share edges"""
+    triangles = np.array([rng.choice(vertex_count, 3, replace=False) for _ in range(face_count)])
+    # strip_triangles_to_triangles_list makes indices relative to the lowest one
+    return triangles - triangles.min()
+
+
+def canonical(triangles):
+    """Multiset of triangles, rotated to start at their lowest index so the winding is kept"""
+    triangles = np.asarray(triangles).reshape(-1, 3).tolist()
+    return Counter(tuple(t[t.index(min(t)):] + t[:t.index(min(t))]) for t in triangles)
+
+
+def round_trip(triangles, allow_jumps):
+    strip = triangles_to_triangles_strip(triangles, allow_jumps=allow_jumps)
+    return strip, strip_triangles_to_triangles_list(strip)
+
+
+@pytest.mark.parametrize('allow_jumps', [True, False])
+@pytest.mark.parametrize('width, height', [(1, 1), (1, 7), (8, 3), (30, 30)])
+def test_grid_round_trip(width, height, allow_jumps):
+    triangles = grid_triangles(width, height)
+    strip, result = round_trip(triangles, allow_jumps)
+
+    assert strip.dtype == np.int32
+    assert canonical(result) == canonical(triangles)
+
+
+@pytest.mark.parametrize('allow_jumps', [True, False])
+@pytest.mark.parametrize('seed', range(20))
+def test_random_round_trip(seed, allow_jumps):
+    rng = np.random.default_rng(seed)
+    triangles = random_triangles(rng, int(rng.integers(1, 300)), int(rng.integers(3, 40)))
+    _, result = round_trip(triangles, allow_jumps)
+
+    assert canonical(result) == canonical(triangles)
+
+
+def test_duplicated_triangles_are_kept():
+    triangles = np.array([(0, 1, 2), (0, 1, 2), (2, 1, 3), (0, 1, 2)])
+    _, result = round_trip(triangles, True)
+
+    assert canonical(result) == canonical(triangles)
+
+
+def test_degenerate_triangles_are_dropped():
+    triangles = np.array([(0, 1, 2), (1, 1, 2), (2, 1, 3), (3, 3, 3)])
+    _, result = round_trip(triangles, True)
+
+    assert canonical(result) == canonical(triangles[[0, 2]])
+
+
+def test_empty():
+    assert len(triangles_to_triangles_strip(np.empty((0, 3), dtype=np.int64))) == 0
+
+
+def test_jumps_give_fewer_strips():
+    triangles = grid_triangles(30, 30)
+    with_jumps = triangles_to_triangles_strip(triangles, allow_jumps=True)
+    without_jumps = triangles_to_triangles_strip(triangles, allow_jumps=False)
+
+    # every strip but the first one adds at least 2 degenerate triangles
+    assert len(with_jumps) <= len(without_jumps)